@@ -5,6 +5,10 @@ from dotenv import load_dotenv
 from extensions import limiter
 from auth import init_firebase_app
 from services.geo import load_readers
+from models.db import init_pool
+from services.blocklist import init_blocklist
+from services.detections import load_rules
+from services.backplane import init_backplane
 
 CITY_DB = os.environ.get("GEOIP_CITY_DB", "/data/GeoLite2-City.mmdb")
 ASN_DB  = os.environ.get("GEOIP_ASN_DB",  "/data/GeoLite2-ASN.mmdb")
@@ -24,6 +28,19 @@ def _load_secret_key() -> str | None:
             logger.error("Failed to read FLASK_SECRET_KEY_FILE %s: %s", path, exc)
     return None
 
+def allowed_origins() -> list[str]:
+    allowed = [o.strip() for o in os.getenv("ALLOWED_ORIGINS", "").split(",") if o.strip()]
+    if not allowed:
+        allowed = [
+            "http://localhost:8080",
+            "http://127.0.0.1:8080",
+            "http://localhost:5173",
+            "http://127.0.0.1:5173",
+            "http://localhost:5175",
+            "http://127.0.0.1:5175"
+        ]
+    return allowed
+
 def create_app():
     load_dotenv()
     app = Flask(__name__)
@@ -32,39 +49,30 @@ def create_app():
     app.config["GEO_READERS"] = readers
     app.extensions["geo"] = readers
 
-    @app.teardown_appcontext
-    def _close_mmdb(exception):
-        rs = app.extensions.get("geo") or app.config.get("GEO_READERS") or {}
-        for r in (rs.get("city"), rs.get("asn")):
-            try:
-                if r:
-                    r.close()
-            except Exception:
-                pass
-
     secret = _load_secret_key()
     if secret:
         app.config["SECRET_KEY"] = secret
     else:
         logger.warning("SECRET_KEY is not set. Provide FLASK_SECRET_KEY or FLASK_SECRET_KEY_FILE.")
 
-    allowed = [o.strip() for o in os.getenv("ALLOWED_ORIGINS", "").split(",") if o.strip()]
-    if not allowed:
-        allowed = [
-            "http://localhost:8080",
-            "http://127.0.0.1:8080",
-            "http://localhost:5173",
-            "http://127.0.0.1:5173",
-            "http://localhost:5175",
-            "http://127.0.0.1:5175"
-        ]
-
-    CORS(app, resources={r"/api/*": {"origins": allowed, "supports_credentials": True}})
+    CORS(app, resources={r"/api/*": {"origins": allowed_origins(), "supports_credentials": True}})
 
     try:
         init_firebase_app(app)
     except Exception as exc:
         logger.warning("Firebase init skipped/failed: %s", exc)
+    try:
+        init_pool()
+    except Exception as exc:
+        logger.warning("DB pool prefill skipped/failed: %s", exc)
+    try:
+        init_blocklist()
+    except Exception as exc:
+        logger.warning("Blocklist index init skipped/failed: %s", exc)
+    try:
+        load_rules()
+    except Exception as exc:
+        logger.error("Detection rules failed to load: %s", exc)
     try:
         limiter.init_app(app)
     except Exception as exc:
@@ -86,6 +94,13 @@ def create_app():
     app.register_blueprint(ops_bp, url_prefix="/api")
     app.register_blueprint(audit_bp, url_prefix="/api")
 
+    try:
+        from routes.traffic import ring as traffic_ring
+        from routes.audit import _ring as audit_ring
+        init_backplane({"traffic": traffic_ring, "audit": audit_ring})
+    except Exception as exc:
+        logger.warning("SSE backplane init skipped/failed: %s", exc)
+
     @app.route("/")
     def home():
         return {"message": "Backend is running!"}
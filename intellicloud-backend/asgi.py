@@ -0,0 +1,90 @@
+"""
+ASGI entrypoint: `uvicorn asgi:app`.
+
+The SSE endpoints are served by coroutines on the event loop, so thousands
+of idle dashboards cost no threads; every other request goes to the Flask
+app on a bounded thread pool (ASGI_WSGI_THREADS) exactly as under gunicorn.
+"""
+import os
+import json
+import asyncio
+from urllib.parse import parse_qs
+from a2wsgi import WSGIMiddleware
+from app import app as flask_app, allowed_origins
+from routes.traffic import ring as traffic_ring, BACKLOG
+from routes.audit import _ring as audit_ring
+from services import sse_async
+from services.stream_filter import FilterError, compile_filter
+
+# path -> (ring, replay, accepts filter query parameters)
+STREAMS = {
+    "/api/stream/traffic": (traffic_ring, BACKLOG, True),
+    "/api/stream/audit": (audit_ring, 50, False),
+}
+
+_wsgi = WSGIMiddleware(flask_app, workers=int(os.getenv("ASGI_WSGI_THREADS", "8")))
+_origins = set(allowed_origins())
+
+def _headers(scope) -> list[tuple[bytes, bytes]]:
+    headers = [
+        (b"content-type", b"text/event-stream"),
+        (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no"),
+    ]
+    origin = dict(scope.get("headers") or []).get(b"origin", b"").decode("latin-1")
+    if origin in _origins:
+        headers += [
+            (b"access-control-allow-origin", origin.encode("latin-1")),
+            (b"access-control-allow-credentials", b"true"),
+            (b"vary", b"Origin"),
+        ]
+    return headers
+
+async def _sse(scope, receive, send, ring, replay: int, filtered: bool):
+    match = None
+    if filtered:
+        try:
+            match = compile_filter(parse_qs(scope.get("query_string", b"").decode("latin-1")))
+        except FilterError as e:
+            body = json.dumps({"error": "bad_filter", "detail": str(e)}).encode()
+            await send({"type": "http.response.start", "status": 400,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+    await send({"type": "http.response.start", "status": 200, "headers": _headers(scope)})
+
+    async def until_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    gone = asyncio.ensure_future(until_disconnect())
+    client = scope.get("client") or ("", 0)
+    body = sse_async.stream(ring, replay=replay, match=match, peer=f"{client[0]}:{client[1]}")
+    try:
+        async for chunk in body:
+            if gone.done():
+                break
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+    except OSError:
+        pass   # client went away mid-write
+    finally:
+        gone.cancel()
+        await body.aclose()
+
+async def _lifespan(receive, send):
+    while True:
+        msg = await receive()
+        if msg["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif msg["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    stream = STREAMS.get(scope.get("path", "")) if scope["type"] == "http" else None
+    if stream and scope.get("method") == "GET":
+        return await _sse(scope, receive, send, *stream)
+    return await _wsgi(scope, receive, send)
@@ -3,7 +3,7 @@ from functools import wraps
 from flask import request, jsonify, g
 import firebase_admin
 from firebase_admin import credentials, auth as fb_auth
-from models.clients import get_client_by_api_key
+from models.clients import resolve_client
 
 _firebase_inited = False
 
@@ -96,7 +96,7 @@ def verify_api(fn):
         if not api_key:
             return jsonify({"error": "missing_api_key"}), 401
 
-        client = get_client_by_api_key(api_key)
+        client = resolve_client(api_key)
         if not client:
             return jsonify({"error": "invalid_api_key"}), 403
 
@@ -0,0 +1,15 @@
+-- Composite indexes backing the threat listing endpoints.
+-- Every listing is ORDER BY id DESC scoped by user or client, optionally
+-- filtered by ip_address and/or threat_level, and paginated with id < after_id.
+
+CREATE INDEX IF NOT EXISTS threats_user_id_id_idx
+    ON threats (user_id, id DESC);
+
+CREATE INDEX IF NOT EXISTS threats_client_id_id_idx
+    ON threats (client_id, id DESC);
+
+CREATE INDEX IF NOT EXISTS threats_ip_address_idx
+    ON threats (ip_address);
+
+CREATE INDEX IF NOT EXISTS threats_client_level_id_idx
+    ON threats (client_id, threat_level, id DESC);
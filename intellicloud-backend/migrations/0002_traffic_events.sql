@@ -0,0 +1,28 @@
+-- Normalized traffic events from /traffic/ingest, range-partitioned by day on ts.
+-- Daily partitions (traffic_events_YYYYMMDD) are created on demand by
+-- models.traffic_events.ensure_partition(); dropping a day is DROP TABLE.
+
+CREATE TABLE IF NOT EXISTS traffic_events (
+    ts        TIMESTAMPTZ NOT NULL,
+    eid       TEXT,
+    src       TEXT,
+    dst       TEXT,
+    proto     TEXT,
+    sport     INTEGER,
+    dport     INTEGER,
+    dir       TEXT,
+    level     TEXT,
+    dns       TEXT,
+    client_id INTEGER,
+    src_geo   JSONB,
+    dst_geo   JSONB
+) PARTITION BY RANGE (ts);
+
+CREATE INDEX IF NOT EXISTS traffic_events_ts_idx
+    ON traffic_events (ts DESC);
+
+CREATE INDEX IF NOT EXISTS traffic_events_src_ts_idx
+    ON traffic_events (src, ts DESC);
+
+CREATE INDEX IF NOT EXISTS traffic_events_client_ts_idx
+    ON traffic_events (client_id, ts DESC);
@@ -0,0 +1,15 @@
+-- HyperLogLog sketches of distinct IPs per client, scope and time bucket.
+-- scope: 'visitors' (collector / tracked_ips) or 'traffic' (traffic ingest sources).
+-- client_id 0 = traffic that wasn't sent with a client key.
+-- registers: precision byte + zlib-compressed HLL registers (services/hll.py);
+-- workers merge into a row by register-wise max, so concurrent flushes never double count.
+
+CREATE TABLE IF NOT EXISTS distinct_sketches (
+    scope       TEXT        NOT NULL,
+    client_id   INTEGER     NOT NULL,
+    granularity INTEGER     NOT NULL,   -- bucket width in seconds (60, 3600)
+    bucket      TIMESTAMPTZ NOT NULL,   -- bucket start
+    registers   BYTEA       NOT NULL,
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (scope, client_id, granularity, bucket)
+);
@@ -0,0 +1,7 @@
+-- Flow records (tools/lines_to_ingest.py with FLOWS=1, services/flows.py) stand in
+-- for many packets: keep their totals (both directions) and duration.
+-- NULL for per-packet events.
+
+ALTER TABLE traffic_events ADD COLUMN IF NOT EXISTS packets  INTEGER;
+ALTER TABLE traffic_events ADD COLUMN IF NOT EXISTS bytes    BIGINT;
+ALTER TABLE traffic_events ADD COLUMN IF NOT EXISTS duration DOUBLE PRECISION;
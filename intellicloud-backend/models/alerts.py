@@ -1,49 +1,118 @@
-from models.db import get_db_connection
+import json
+from psycopg2.extras import Json, execute_values
+from models.db import db_connection
+
+BLOCKLIST_CHANNEL = "ip_blocklist"
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, default=str)
 
 def create_alert(client_id: int | None, rule_id: str, severity: str, title: str, details: dict) -> int | None:
-    conn = get_db_connection()
-    if not conn:
-        print("No DB connection")
-        return None
-    try:
-        with conn, conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO alerts (client_id, rule_id, severity, title, details)
-                VALUES (%s, %s, %s, %s, %s,)
-                RETURNING id
-                """, (client_id, rule_id, severity, title, details)
-            )
-            row = cur.fetchone()
-            return row["id"] if row else None
-    except Exception as e:
-        print("create_alert failed:", e)
-        return None
-    
+    with db_connection() as conn:
+        if not conn:
+            print("No DB connection")
+            return None
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO alerts (client_id, rule_id, severity, title, details)
+                    VALUES (%s, %s, %s, %s, %s)
+                    RETURNING id
+                    """, (client_id, rule_id, severity, title, Json(details, dumps=_dumps))
+                )
+                row = cur.fetchone()
+                return row["id"] if row else None
+        except Exception as e:
+            print("create_alert failed:", e)
+            return None
+
+def create_alerts_bulk(rows: list[tuple]) -> list[int | None]:
+    """
+    rows: (client_id, rule_id, severity, title, details) tuples.
+    One multi-row INSERT ... RETURNING; ids come back in input order ([None] * n on failure).
+    """
+    if not rows:
+        return []
+    with db_connection() as conn:
+        if not conn:
+            print("No DB connection")
+            return [None] * len(rows)
+        try:
+            with conn, conn.cursor() as cur:
+                out = execute_values(
+                    cur,
+                    "INSERT INTO alerts (client_id, rule_id, severity, title, details) VALUES %s RETURNING id",
+                    [(c, r, s, t, Json(d, dumps=_dumps)) for c, r, s, t, d in rows],
+                    page_size=1000,
+                    fetch=True,
+                )
+                return [r["id"] for r in out]
+        except Exception as e:
+            print("create_alerts_bulk failed:", e)
+            return [None] * len(rows)
+
 def block_ip(client_id: int | None, ip: str, reason: str) -> None:
-    conn = get_db_connection()
-    if not conn:
+    with db_connection() as conn:
+        if not conn:
+            return
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO ip_blocklist (client_id, ip_address, reason) Values (%s, %s, %s)
+                    ON CONFLICT DO NOTHING
+                    """, (client_id, ip, reason))
+                # delivered to every worker's blocklist listener on commit
+                cur.execute("SELECT pg_notify(%s, %s)", (BLOCKLIST_CHANNEL, ip))
+        except Exception as e:
+            print("block_ip failed: ", e)
+
+def block_ips_bulk(rows: list[tuple]) -> None:
+    """rows: (client_id, ip, reason) tuples. One upsert plus one NOTIFY per distinct ip, in one transaction."""
+    if not rows:
         return
-    try:
-        with conn, conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO ip_blocklist (client_id, ip_address, reason) Values (%s, %s, %s) 
-                ON CONFLICT DO NOTHING
-                """, (client_id, ip, reason))
-    except Exception as e:
-        print("block_ip failed: ", e)
+    with db_connection() as conn:
+        if not conn:
+            return
+        try:
+            with conn, conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    "INSERT INTO ip_blocklist (client_id, ip_address, reason) VALUES %s ON CONFLICT DO NOTHING",
+                    rows,
+                    page_size=1000,
+                )
+                cur.execute(
+                    "SELECT pg_notify(%s, ip) FROM unnest(%s::text[]) AS ip",
+                    (BLOCKLIST_CHANNEL, sorted({ip for _, ip, _ in rows})),
+                )
+        except Exception as e:
+            print("block_ips_bulk failed: ", e)
 
 def is_ip_blocked(ip:str) -> bool:
-    conn = get_db_connection()
-    if not conn:
-        return False
-    try:
-        with conn, conn.cursor() as cur:
-            cur.execute("""
-                SELECT 1 FROM ip_blocklist
-                WHERE ip_address = %s
-                LIMIT 1
-                """, (ip,)
-            )
-            return cur.fetchone() is not None
-    except Exception:
-        return False
+    with db_connection() as conn:
+        if not conn:
+            return False
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT 1 FROM ip_blocklist
+                    WHERE ip_address = %s
+                    LIMIT 1
+                    """, (ip,)
+                )
+                return cur.fetchone() is not None
+        except Exception:
+            return False
+
+def load_blocklist() -> list[str] | None:
+    """All blocked addresses/networks as strings, or None if the DB is unreachable."""
+    with db_connection() as conn:
+        if not conn:
+            return None
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute("SELECT DISTINCT ip_address::text AS ip FROM ip_blocklist")
+                return [r["ip"] for r in cur.fetchall()]
+        except Exception as e:
+            print("load_blocklist failed:", e)
+            return None
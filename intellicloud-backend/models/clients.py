@@ -1,80 +1,134 @@
+import os
 import secrets
-from models.db import get_db_connection
+import threading
+from cachetools import TTLCache
+from models.db import db_connection
+
+CLIENT_CACHE_SIZE = int(os.getenv("CLIENT_CACHE_SIZE", "1024"))
+CLIENT_CACHE_TTL = float(os.getenv("CLIENT_CACHE_TTL", "300"))
+CLIENT_CACHE_NEGATIVE_TTL = float(os.getenv("CLIENT_CACHE_NEGATIVE_TTL", "30"))
+
+# api_key -> client row; unknown keys are remembered separately for a shorter time
+_client_cache = TTLCache(maxsize=CLIENT_CACHE_SIZE, ttl=CLIENT_CACHE_TTL)
+_invalid_keys = TTLCache(maxsize=CLIENT_CACHE_SIZE * 4, ttl=CLIENT_CACHE_NEGATIVE_TTL)
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "negative_hits": 0, "misses": 0, "errors": 0}
 
 def create_client(name: str, domain: str | None = None):
-    conn = get_db_connection()
-    if not conn:
-        print("No DB connection")
-        return None
-    try:
-        api_key = secrets.token_hex(16)
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO clients (client_name, domain, api_key)
-                    VALUES (%s, %s, %s)
-                    RETURNING client_id, client_name, domain, api_key, created_at
-                    """, 
-                    (name, domain, api_key)
-                )
-            row = cur.fetchone()
+    with db_connection() as conn:
+        if not conn:
+            print("No DB connection")
+            return None
+        try:
+            api_key = secrets.token_hex(16)
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO clients (client_name, domain, api_key)
+                        VALUES (%s, %s, %s)
+                        RETURNING client_id, client_name, domain, api_key, created_at
+                        """,
+                        (name, domain, api_key)
+                    )
+                    row = cur.fetchone()
+            if row:
+                invalidate_client_cache(row["api_key"])
             return row
 
-    except Exception as e:
-        print("Failed to create client:", e)
-        return None
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
-    
+        except Exception as e:
+            print("Failed to create client:", e)
+            return None
+
 def get_all_clients():
-    conn = get_db_connection()
-    if not conn:
-        print("Cannot connect to DB")
-        return []
-    try:
+    with db_connection() as conn:
+        if not conn:
+            print("Cannot connect to DB")
+            return []
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute("""
+                            SELECT client_id, client_name, domain, api_key, created_at
+                            FROM clients
+                            ORDER BY client_id DESC
+                            """
+                        )
+                rows = cur.fetchall()
+                return rows
+        except Exception as e:
+            print("Failed to retrieve clients: ", e)
+            return []
+
+def _select_client_by_api_key(api_key: str):
+    """Look up a client row; raises when the database can't be reached."""
+    with db_connection() as conn:
+        if not conn:
+            raise RuntimeError("No DB connection")
         with conn, conn.cursor() as cur:
             cur.execute("""
-                        SELECT client_id, client_name, domain, api_key, created_at 
-                        FROM clients
-                        ORDER BY client_id DESC
-                        """
-                    )
-            rows = cur.fetchall()
-            return rows 
-    except Exception as e:
-        print("Failed to retrieve clients: ", e)
-        return []
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
-    
+                SELECT client_id, client_name, domain, created_at
+                FROM clients
+                WHERE api_key = %s
+                """,
+                (api_key,),
+            )
+            return cur.fetchone()
+
 def get_client_by_api_key(api_key: str):
-    conn = get_db_connection()
-    if not conn:
-        print("No DB connection")
+    try:
+        return _select_client_by_api_key(api_key)
+    except Exception as e:
+        print("Failed to lookup client by API key: ", e)
+        return None
+
+def resolve_client(api_key: str):
+    """
+    Cached get_client_by_api_key() shared by every API-key gate.
+    Known keys are cached for CLIENT_CACHE_TTL seconds and unknown keys for
+    CLIENT_CACHE_NEGATIVE_TTL, so key-guessing floods don't reach Postgres.
+    Lookup failures are never cached. Returns a copy of the row or None.
+    """
+    if not api_key:
         return None
-    
+    with _cache_lock:
+        row = _client_cache.get(api_key)
+        if row is not None:
+            _cache_stats["hits"] += 1
+            return dict(row)
+        if api_key in _invalid_keys:
+            _cache_stats["negative_hits"] += 1
+            return None
+        _cache_stats["misses"] += 1
+
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT client_id, client_name, domain, created_at 
-                FROM clients 
-                WHERE api_key = %s", 
-                """, 
-                (api_key,),
-            )
-            row = cur.fetchone()
-            return row
+        row = _select_client_by_api_key(api_key)
     except Exception as e:
+        with _cache_lock:
+            _cache_stats["errors"] += 1
         print("Failed to lookup client by API key: ", e)
         return None
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
\ No newline at end of file
+
+    with _cache_lock:
+        if row:
+            _client_cache[api_key] = dict(row)
+        else:
+            _invalid_keys[api_key] = True
+    return dict(row) if row else None
+
+def invalidate_client_cache(api_key: str | None = None) -> None:
+    """Forget one key (or everything) so the next resolve_client() re-reads the database."""
+    with _cache_lock:
+        if api_key is None:
+            _client_cache.clear()
+            _invalid_keys.clear()
+        else:
+            _client_cache.pop(api_key, None)
+            _invalid_keys.pop(api_key, None)
+
+def client_cache_stats() -> dict:
+    with _cache_lock:
+        out = dict(_cache_stats)
+        out["size"] = len(_client_cache)
+        out["negative_size"] = len(_invalid_keys)
+    lookups = out["hits"] + out["negative_hits"] + out["misses"]
+    out["hit_rate"] = round((out["hits"] + out["negative_hits"]) / lookups, 4) if lookups else 0.0
+    return out
@@ -0,0 +1,89 @@
+from datetime import datetime
+from typing import Callable
+from psycopg2 import Binary
+from psycopg2.extras import execute_values
+from models.db import db_connection
+
+SKETCH_KEY = ("scope", "client_id", "granularity", "bucket")
+
+def merge_sketches(rows: list[tuple], merge: Callable[[bytes, bytes], bytes]) -> int:
+    """
+    Merge sketches into distinct_sketches. rows: (scope, client_id, granularity, bucket, blob).
+    New keys are inserted as-is; existing rows are locked and replaced with
+    merge(stored, ours), so concurrent workers can flush the same bucket.
+    Raises on failure so the caller can keep the sketches dirty. Returns rows written.
+    """
+    if not rows:
+        return 0
+    ours = {tuple(r[:4]): bytes(r[4]) for r in rows}
+
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("no DB connection")
+        with conn, conn.cursor() as cur:
+            created = execute_values(
+                cur,
+                f"INSERT INTO distinct_sketches ({', '.join(SKETCH_KEY)}, registers) VALUES %s "
+                "ON CONFLICT DO NOTHING RETURNING scope, client_id, granularity, bucket",
+                [(*key, Binary(blob)) for key, blob in ours.items()],
+                fetch=True,
+            )
+            inserted = {(r["scope"], r["client_id"], r["granularity"], r["bucket"]) for r in created}
+            existing = [key for key in ours if key not in inserted]
+            if not existing:
+                return len(ours)
+
+            stored = execute_values(
+                cur,
+                "SELECT d.scope, d.client_id, d.granularity, d.bucket, d.registers "
+                "FROM distinct_sketches d JOIN (VALUES %s) AS k (scope, client_id, granularity, bucket) "
+                "USING (scope, client_id, granularity, bucket) "
+                "ORDER BY d.scope, d.client_id, d.granularity, d.bucket FOR UPDATE OF d",
+                existing,
+                template="(%s, %s, %s, %s::timestamptz)",
+                fetch=True,
+            )
+            updates = []
+            for r in stored:
+                key = (r["scope"], r["client_id"], r["granularity"], r["bucket"])
+                mine = ours.get(key)
+                if mine is None:
+                    continue
+                old = bytes(r["registers"])
+                new = merge(old, mine)
+                if new != old:
+                    updates.append((*key, Binary(new)))
+            if updates:
+                execute_values(
+                    cur,
+                    "UPDATE distinct_sketches d SET registers = v.registers, updated_at = now() "
+                    "FROM (VALUES %s) AS v (scope, client_id, granularity, bucket, registers) "
+                    "WHERE d.scope = v.scope AND d.client_id = v.client_id "
+                    "AND d.granularity = v.granularity AND d.bucket = v.bucket",
+                    updates,
+                    template="(%s, %s, %s, %s::timestamptz, %s::bytea)",
+                )
+            return len(inserted) + len(updates)
+
+def load_sketches(scope: str, client_id: int, granularity: int,
+                  start: datetime, end: datetime) -> list[tuple[datetime, bytes]]:
+    """Persisted (bucket, blob) pairs with start <= bucket < end, oldest first."""
+    with db_connection() as conn:
+        if not conn:
+            print("No DB connection")
+            return []
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT bucket, registers FROM distinct_sketches
+                    WHERE scope = %s AND client_id = %s AND granularity = %s
+                      AND bucket >= %s AND bucket < %s
+                    ORDER BY bucket
+                    """,
+                    (scope, client_id, granularity, start, end),
+                )
+                return [(r["bucket"], bytes(r["registers"])) for r in cur.fetchall()]
+        except Exception as e:
+            print("Failed to load distinct sketches:", e)
+            return []
@@ -1,88 +1,137 @@
-from models.db import get_db_connection
+from models.db import db_connection, copy_rows
+from psycopg2.extras import execute_values
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 from auth import require_auth, require_role, verify_api
 import secrets
 
-def get_threats_for_user(user_id: str) -> List[dict]:
-    conn = get_db_connection()
-    if not conn:
-        print("Could not connect to DB")
-        return []
-    
-    try:
-        with conn, conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT id, ip_address, threat_level, description, timestamp 
-                FROM threats 
-                WHERE user_id = %s
-                """, 
-                (user_id,),
-            )
-            rows = cur.fetchall()
-            
-            for r in rows:
-                if r.get("timestamp") and hasattr(r["timestamp"], "isoformat"):
-                    r["timestamp"] = r["timestamp"].isoformat()
-            return rows
-    except Exception as e:
-            print("Error fetching user threats: ", e)
-            return[]
-    
-def get_threats_for_client(client_id: int) -> List[dict]:
-    conn = get_db_connection()
-    if not conn:
-        print("Unable to connect to DB")
-        return []
-    
-    try:
-        with conn, conn.cursor() as cur:
-            cur.execute(
-            """
-            SELECT id, ip_address, threat_level, description, timestamp
-            FROM threats 
-            WHERE client_id = %s
-            ORDER BY id DESC
-            """, 
-            (client_id,),
-            )
-            rows = cur.fetchall()
-            for r in rows:
-                if r.get("timestamp") and hasattr(r["timestamp"], "isoformat"):
-                    r["timestamp"] = r["timestamp"].isoformat()
-            return rows
-    except Exception as e:
-        print("Error fetching threats for client", e)
-        return []
-
-def get_threats_from_db(ip: Optional[str] = None, threat_level: Optional[int] = None) -> List[dict]:
-    conn = get_db_connection()
-    if not conn:
-        print("No DB connection")
-        return []
-    try:
-        where, params = [], []
-        if ip:
-            where.append("ip_address = %s "); params.append(ip)
-        if threat_level is not None:
-            where.append("threat_level = %s"); params.append(threat_level)
-
-        sql = "SELECT id, ip_address, threat_level, description, timestamp FROM threats"
-        if where:
-            sql += " WHERE " + " AND ".join(where)
-        sql += " ORDER BY id DESC"
-
-        with conn, conn.cursor() as cur:
-            cur.execute(sql, tuple(params))
-            rows = cur.fetchall()
-            for r in rows:
-                if r.get("timestamp") and hasattr(r["timestamp"], "isoformat"):
-                    r["timestamp"] = r["timestamp"].isoformat()
-            return rows
-    except Exception as e:
-        print("Failed to fetch threats: ", e)
-        return []
+THREAT_FIELDS = "id, ip_address, threat_level, description, timestamp"
+MAX_PAGE_SIZE = 1000
+
+def _isoformat_row(r):
+    if r.get("timestamp") and hasattr(r["timestamp"], "isoformat"):
+        r["timestamp"] = r["timestamp"].isoformat()
+    return r
+
+def _isoformat_rows(rows):
+    for r in rows:
+        _isoformat_row(r)
+    return rows
+
+def _threats_query(
+    where: List[str],
+    params: List[Any],
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> tuple[str, tuple]:
+    """Build a threats SELECT with keyset pagination on `ORDER BY id DESC`."""
+    where, params = list(where), list(params)
+    if after_id is not None:
+        where.append("id < %s"); params.append(after_id)
+
+    sql = f"SELECT {THREAT_FIELDS} FROM threats"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC"
+    if limit is not None:
+        sql += " LIMIT %s"; params.append(limit)
+    return sql, tuple(params)
+
+def _threat_filters(
+    user_id: Optional[str] = None,
+    client_id: Optional[int] = None,
+    ip: Optional[str] = None,
+    threat_level: Optional[int] = None,
+) -> tuple[List[str], List[Any]]:
+    where, params = [], []
+    if user_id is not None:
+        where.append("user_id = %s"); params.append(user_id)
+    if client_id is not None:
+        where.append("client_id = %s"); params.append(client_id)
+    if ip:
+        where.append("ip_address = %s"); params.append(ip)
+    if threat_level is not None:
+        where.append("threat_level = %s"); params.append(threat_level)
+    return where, params
+
+def _fetch_threats(sql: str, params: tuple, error_msg: str) -> List[dict]:
+    with db_connection() as conn:
+        if not conn:
+            print(f"{error_msg}: no DB connection")
+            return []
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(sql, params)
+                return _isoformat_rows(cur.fetchall())
+        except Exception as e:
+            print(f"{error_msg}: ", e)
+            return []
+
+def get_threats_for_user(
+    user_id: str,
+    ip: Optional[str] = None,
+    threat_level: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> List[dict]:
+    where, params = _threat_filters(user_id=user_id, ip=ip, threat_level=threat_level)
+    sql, params = _threats_query(where, params, after_id, limit)
+    return _fetch_threats(sql, params, "Error fetching user threats")
+
+def get_threats_for_client(
+    client_id: int,
+    ip: Optional[str] = None,
+    threat_level: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> List[dict]:
+    where, params = _threat_filters(client_id=client_id, ip=ip, threat_level=threat_level)
+    sql, params = _threats_query(where, params, after_id, limit)
+    return _fetch_threats(sql, params, "Error fetching threats for client")
+
+def get_threats_from_db(
+    ip: Optional[str] = None,
+    threat_level: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> List[dict]:
+    where, params = _threat_filters(ip=ip, threat_level=threat_level)
+    sql, params = _threats_query(where, params, after_id, limit)
+    return _fetch_threats(sql, params, "Failed to fetch threats")
+
+def get_threat_for_user(user_id: str, threat_id: int) -> Optional[dict]:
+    """Single-row lookup on the threats primary key, scoped to the owning user."""
+    rows = _fetch_threats(
+        f"SELECT {THREAT_FIELDS} FROM threats WHERE id = %s AND user_id = %s",
+        (threat_id, user_id),
+        "Error fetching threat",
+    )
+    return rows[0] if rows else None
+
+def stream_threats(
+    user_id: Optional[str] = None,
+    client_id: Optional[int] = None,
+    ip: Optional[str] = None,
+    threat_level: Optional[int] = None,
+    after_id: Optional[int] = None,
+    itersize: int = 500,
+) -> Iterator[dict]:
+    """
+    Yield threats newest-first through a named server-side cursor, fetching
+    `itersize` rows per round-trip. Holds one pooled connection until exhausted or closed.
+    """
+    where, params = _threat_filters(user_id, client_id, ip, threat_level)
+    sql, params = _threats_query(where, params, after_id)
+
+    with db_connection() as conn:
+        if not conn:
+            print("Cannot stream threats: no DB connection")
+            return
+        with conn, conn.cursor(name="threats_stream") as cur:
+            cur.itersize = itersize
+            cur.execute(sql, params)
+            for r in cur:
+                yield _isoformat_row(r)
 
 
 def insert_threat(
@@ -93,165 +142,201 @@ def insert_threat(
     user_id: Optional[str] = None,
     client_id: Optional[int] = None,
 ) -> Optional[int]:
-    
-    conn = get_db_connection()
-    if not conn:
-        print("Cannot insert threat: no DB connection")
-        return
-
-    try:
-        with conn,conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO threats (ip_address, threat_level, description, timestamp, user_id, client_id)
-                VALUES (%s, %s, %s, COALESCE (%s, now()), %s, %s)
-                RETURNING id
-                """, 
-                (ip_address, threat_level, description, timestamp, user_id, client_id),
-            )
-            row = cur.fetchone()
-            return row["id"] if row else None
-    except Exception as e:
-        print("Database insert failed: ", e)
-        return None
+
+    with db_connection() as conn:
+        if not conn:
+            print("Cannot insert threat: no DB connection")
+            return
+
+        try:
+            with conn,conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO threats (ip_address, threat_level, description, timestamp, user_id, client_id)
+                    VALUES (%s, %s, %s, COALESCE (%s, now()), %s, %s)
+                    RETURNING id
+                    """,
+                    (ip_address, threat_level, description, timestamp, user_id, client_id),
+                )
+                row = cur.fetchone()
+                return row["id"] if row else None
+        except Exception as e:
+            print("Database insert failed: ", e)
+            return None
+
+THREAT_COLUMNS = ("ip_address", "threat_level", "description", "timestamp", "user_id", "client_id")
+
+def insert_threats_bulk(rows: List[Dict[str, Any]], return_ids: bool = False, page_size: int = 1000) -> List[int] | int:
+    """
+    Insert many threats in one transaction.
+    rows: dicts with insert_threat()'s keyword arguments (ip_address and threat_level required).
+    With return_ids=True uses multi-row INSERT ... RETURNING and returns the new ids in input order;
+    otherwise streams the rows with COPY and returns the number written.
+    """
+    if not rows:
+        return [] if return_ids else 0
+
+    now = datetime.utcnow()
+    values = [
+        (
+            r["ip_address"],
+            r["threat_level"],
+            r.get("description"),
+            r.get("timestamp") or now,
+            r.get("user_id"),
+            r.get("client_id"),
+        )
+        for r in rows
+    ]
+
+    with db_connection() as conn:
+        if not conn:
+            print("Cannot bulk insert threats: no DB connection")
+            return [] if return_ids else 0
+        try:
+            with conn, conn.cursor() as cur:
+                if return_ids:
+                    out = execute_values(
+                        cur,
+                        f"INSERT INTO threats ({', '.join(THREAT_COLUMNS)}) VALUES %s RETURNING id",
+                        values,
+                        page_size=page_size,
+                        fetch=True,
+                    )
+                    return [r["id"] for r in out]
+                return copy_rows(cur, "threats", THREAT_COLUMNS, values)
+        except Exception as e:
+            print("Bulk threat insert failed: ", e)
+            return [] if return_ids else 0
 
 def get_all_threats() -> List[dict]:
-    conn = get_db_connection()
-    if not conn:
-        print("Cannot fetch threats: no DB connection")
-        return[]
-    
-    try:
-        with conn, conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT id, ip_address, threat_level, description, timestamp 
-                FROM 
-                ORDER BY id DESC
-                """
-            )
-        rows = cur.fetchall()
-        for r in rows:
-            if r.get("timestamp") and hasattr(r["timestamp"], "isoformat"):
-                r["timestamp"] = r["timestamp"].isoformat()
-        return rows
-    except Exception as e:
-        print("Failed to fetch threats: ", e)
-        return[]
+    with db_connection() as conn:
+        if not conn:
+            print("Cannot fetch threats: no DB connection")
+            return[]
+
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT id, ip_address, threat_level, description, timestamp
+                    FROM threats
+                    ORDER BY id DESC
+                    """
+                )
+                rows = cur.fetchall()
+            return _isoformat_rows(rows)
+        except Exception as e:
+            print("Failed to fetch threats: ", e)
+            return[]
 
 def delete_threat_by_id(user_id: str, threat_id: int) -> bool:
-    conn = get_db_connection()
-    if not conn:
+    with db_connection() as conn:
+        if not conn:
+                print("Cannot delete threat: no DB connection")
+                return False
+
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(
+                    """
+                    DELETE FROM threats
+                    WHERE id = %s AND user_id = %s
+                    """,
+                    (threat_id, user_id),
+                )
+                return cur.rowcount > 0
+        except Exception as e:
+                print("Failed to delete threat:", e)
+                return False
+
+def update_threat_by_id(user_id: str, threat_id: int, updates: Dict[str, Any]) -> bool:
+    with db_connection() as conn:
+        if not conn:
             print("Cannot delete threat: no DB connection")
             return False
+        try:
+            set_parts, values = [], []
+            if "threat_level" in updates:
+                set_parts.append("threat_level = %s")
+                values.append(updates["threat_level"])
+            if "description" in updates:
+                set_parts.append("description = %s")
+                values.append(updates["description"])
+            if not set_parts:
+                return False
 
-    try:
-        with conn, conn.cursor() as cur:
-            cur.execute(
-                """
-                DELETE FROM threats 
-                WHERE id = %s AND user_id = %s
-                """, 
-                (threat_id, user_id),
-            )
-            return cur.rowcount > 0
-    except Exception as e:
-            print("Failed to delete threat:", e)
-            return False
+            values.extend([threat_id, user_id])
+            sql = f"UPDATE threats SET {', '.join(set_parts)} WHERE id = %s AND user_id = %s"
 
-def update_threat_by_id(user_id: str, threat_id: int, updates: Dict[str, Any]) -> bool:
-    conn = get_db_connection()
-    if not conn:
-        print("Cannot delete threat: no DB connection")
-        return False
-    try:
-        set_parts, values = [], []
-        if "threat_level" in updates:
-            set_parts.append("threat_level = %s")
-            values.append(updates["threat_level"])
-        if "description" in updates:
-            set_parts.append("description = %s")
-            values.append(updates["description"])
-        if not set_parts:
+            with conn, conn.cursor() as cur:
+                cur.execute(sql, values)
+                return cur.rowcount > 0
+
+        except Exception as e:
+            print("Failed to update threat:")
+            print(e)
             return False
-    
-        values.extend([threat_id, user_id])
-        sql = f"UPDATE threats SET {', '.join(set_parts)} WHERE id = %s AND user_id = %s"
-
-        with conn, conn.cursor() as cur:
-            cur.execute(sql, values)
-            return cur.rowcount > 0
-    
-    except Exception as e:
-        print("Failed to update threat:")
-        print(e)
-        return False
 
 def get_audit_logs() -> List[dict]:
-    conn = get_db_connection()
-    if not conn:
-        print("Cannot delete threat: no DB connection")
-        return []
-    
-    try:
-        with conn, conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT log_id, action, user_id, target_id, timestamp 
-                FROM audit_log 
-                ORDER 
-                BY timestamp DESC
-                """
-            )
-            rows = cur.fetchall()
-            for r in rows:
-                if r.get("timestamp") and hasattr(r["timestamp"], "isoformat"):
-                    r["timestamp"] = r["timestamp"].isoformat()
-            return rows
-    except Exception as e:
-        print("Failed to fetch audit logs:")
-        print(e)
-        return []
-    
+    with db_connection() as conn:
+        if not conn:
+            print("Cannot delete threat: no DB connection")
+            return []
+
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT log_id, action, user_id, target_id, timestamp
+                    FROM audit_log
+                    ORDER
+                    BY timestamp DESC
+                    """
+                )
+                rows = cur.fetchall()
+                return _isoformat_rows(rows)
+        except Exception as e:
+            print("Failed to fetch audit logs:")
+            print(e)
+            return []
+
 def get_audit_logs_for_user(user_id: str) -> List[dict]:
-    conn = get_db_connection()
-    if not conn:
-        print("Cannot fetch audit logs for user: no DB connection")
-        return []
-    
-    try:
-        with conn, conn.cursor() as cur:
-
-            cur.execute(
-                """
-                SELECT log_id, action, user_id, target_id, timestamp 
-                FROM audit_log 
-                WHERE user_id = %s 
-                ORDER BY timestamp DESC
-                """,
-                (user_id,),
-            )
+    with db_connection() as conn:
+        if not conn:
+            print("Cannot fetch audit logs for user: no DB connection")
+            return []
+
+        try:
+            with conn, conn.cursor() as cur:
+
+                cur.execute(
+                    """
+                    SELECT log_id, action, user_id, target_id, timestamp
+                    FROM audit_log
+                    WHERE user_id = %s
+                    ORDER BY timestamp DESC
+                    """,
+                    (user_id,),
+                )
+
+                rows = cur.fetchall()
+            return _isoformat_rows(rows)
+        except Exception as e:
+            print("Failed to fetch audit logs for user:", e)
+            return []
 
-        rows = cur.fetchall()
-        for r in rows:
-            if r.get("timestamp") and hasattr(r["timestamp"], "isoformat"):
-                r["timestamp"] = r["timestamp"].isoformat()
-        return rows
-    except Exception as e:
-        print("Failed to fetch audit logs for user:", e)
-        return []
-    
 def log_action(action: str, user_id: str, target_id: int | None = None) -> None:
-    conn = get_db_connection()
-    if not conn:
-        print("Cannot log action: no DB conncetion")
-        return
-    try:
-        with conn, conn.cursor() as cur:
-
-            cur.execute("""
-                INSERT INTO audit_log (action, user_id, target_id)
-                VALUES (%s, %s, %s)
-            """, (action, user_id, target_id)
-        )
-    except Exception as e:
-        print("Failed to log action:", e)
+    with db_connection() as conn:
+        if not conn:
+            print("Cannot log action: no DB conncetion")
+            return
+        try:
+            with conn, conn.cursor() as cur:
+
+                cur.execute("""
+                    INSERT INTO audit_log (action, user_id, target_id)
+                    VALUES (%s, %s, %s)
+                """, (action, user_id, target_id)
+            )
+        except Exception as e:
+            print("Failed to log action:", e)
@@ -1,28 +1,67 @@
-from models.db import get_db_connection
+from models.db import db_connection, copy_rows
+from psycopg2.extras import execute_values
 from datetime import datetime
 
 def log_visitor_ip(ip: str, user_agent: str, client_id: int) -> dict | None:
-    conn = get_db_connection()
-    if not conn:
-        print("No DB connection")
-        return None
-    
-    try:
-        with conn, conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO  tracked_ips (ip, user_agent, client_id, timestamp)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id, timestamp;
-            """, 
-            (ip, user_agent, client_id, datetime.utcnow())
-        )
-        row = cur.fetchone()
-        if not row:
+    with db_connection() as conn:
+        if not conn:
+            print("No DB connection")
             return None
-        ts = row["timestamp"].isoformat() if hasattr(row["timestamp"], "isoformat") else row["timestamp"]
-        return {"id": row["id"], "timestamp": ts}
-    except Exception as e:
-        print("Failed to log visitor IP:", e)
-        return None
-    
\ No newline at end of file
+
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO  tracked_ips (ip, user_agent, client_id, timestamp)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING id, timestamp;
+                """,
+                (ip, user_agent, client_id, datetime.utcnow())
+            )
+                row = cur.fetchone()
+            if not row:
+                return None
+            ts = row["timestamp"].isoformat() if hasattr(row["timestamp"], "isoformat") else row["timestamp"]
+            return {"id": row["id"], "timestamp": ts}
+        except Exception as e:
+            print("Failed to log visitor IP:", e)
+            return None
+
+VISIT_COLUMNS = ("ip", "user_agent", "client_id", "timestamp")
+
+def log_visits_bulk(rows: list[dict], return_ids: bool = False, page_size: int = 1000) -> list[dict] | int:
+    """
+    Log many visits in one transaction. rows: {ip, user_agent, client_id, timestamp?}.
+    With return_ids=True returns [{id, timestamp}] in input order, otherwise the number written (via COPY).
+    """
+    if not rows:
+        return [] if return_ids else 0
+
+    now = datetime.utcnow()
+    values = [(r["ip"], r.get("user_agent"), r["client_id"], r.get("timestamp") or now) for r in rows]
+
+    with db_connection() as conn:
+        if not conn:
+            print("No DB connection")
+            return [] if return_ids else 0
+        try:
+            with conn, conn.cursor() as cur:
+                if not return_ids:
+                    return copy_rows(cur, "tracked_ips", VISIT_COLUMNS, values)
+                out = execute_values(
+                    cur,
+                    f"INSERT INTO tracked_ips ({', '.join(VISIT_COLUMNS)}) VALUES %s RETURNING id, timestamp",
+                    values,
+                    page_size=page_size,
+                    fetch=True,
+                )
+            return [
+                {
+                    "id": r["id"],
+                    "timestamp": r["timestamp"].isoformat() if hasattr(r["timestamp"], "isoformat") else r["timestamp"],
+                }
+                for r in out
+            ]
+        except Exception as e:
+            print("Failed to bulk log visits:", e)
+            return [] if return_ids else 0
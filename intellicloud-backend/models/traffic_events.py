@@ -0,0 +1,107 @@
+import threading
+from datetime import date, datetime, timedelta, timezone
+from models.db import db_connection, copy_rows
+
+TRAFFIC_COLUMNS = ("ts", "eid", "src", "dst", "proto", "sport", "dport",
+                   "dir", "level", "dns", "client_id", "src_geo", "dst_geo",
+                   "packets", "bytes", "duration")
+
+_known_partitions: set = set()
+_partition_lock = threading.Lock()
+
+def partition_name(day: date) -> str:
+    return f"traffic_events_{day:%Y%m%d}"
+
+def _port(v):
+    return v if isinstance(v, int) and 0 <= v <= 65535 else None
+
+def _count(v):
+    return v if isinstance(v, int) and not isinstance(v, bool) and v >= 0 else None
+
+def _total(ev: dict, key: str):
+    """Both directions of a flow counter (packets/bytes); None for packet events."""
+    fwd = _count(ev.get(key))
+    if fwd is None:
+        return None
+    return fwd + (_count(ev.get("resp_" + key)) or 0)
+
+def event_ts(ev: dict) -> float:
+    """Epoch seconds of an event; anything unusable (missing, NaN, year > 9999) means now."""
+    try:
+        ts = float(ev.get("ts"))
+    except (TypeError, ValueError):
+        ts = -1.0
+    if not 0 <= ts < 253402300800:   # also false for NaN
+        return datetime.now(timezone.utc).timestamp()
+    return ts
+
+def event_day(ev: dict) -> date:
+    return datetime.fromtimestamp(event_ts(ev), timezone.utc).date()
+
+def event_row(ev: dict) -> tuple:
+    """Normalized traffic event -> row in TRAFFIC_COLUMNS order."""
+    client_id = ev.get("client_id")
+    return (
+        datetime.fromtimestamp(event_ts(ev), timezone.utc),
+        ev.get("eid"),
+        ev.get("src"),
+        ev.get("dst"),
+        ev.get("proto"),
+        _port(ev.get("sport")),
+        _port(ev.get("dport")),
+        ev.get("dir"),
+        ev.get("level"),
+        ev.get("dns") or None,
+        client_id if isinstance(client_id, int) else None,
+        ev.get("src_geo") or None,
+        ev.get("dst_geo") or None,
+        _total(ev, "packets"),
+        _total(ev, "bytes"),
+        float(ev["duration"]) if isinstance(ev.get("duration"), (int, float)) else None,
+    )
+
+def ensure_partition(cur, day: date) -> None:
+    """
+    Create the daily partition for `day` if this process hasn't seen it yet.
+    Bounds are UTC midnights, matching event_day(), whatever the session TimeZone is.
+    """
+    name = partition_name(day)
+    if name in _known_partitions:
+        return
+    with _partition_lock:
+        if name in _known_partitions:
+            return
+        cur.execute("SELECT to_regclass(%s) AS rel", (name,))
+        row = cur.fetchone()
+        if not row or not row["rel"]:
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF traffic_events "
+                "FOR VALUES FROM (%s) TO (%s)",
+                (f"{day.isoformat()} 00:00:00+00", f"{(day + timedelta(days=1)).isoformat()} 00:00:00+00"),
+            )
+        _known_partitions.add(name)
+
+def copy_traffic_events(events: list[dict]) -> int:
+    """
+    COPY normalized events into traffic_events in one transaction, creating
+    any missing daily partitions first. Raises on failure (including no DB
+    connection) so the caller can spill the batch elsewhere.
+    """
+    if not events:
+        return 0
+    rows = [event_row(ev) for ev in events]
+    days = {r[0].date() for r in rows}
+
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("no DB connection")
+        try:
+            with conn, conn.cursor() as cur:
+                for day in sorted(days):
+                    ensure_partition(cur, day)
+                return copy_rows(cur, "traffic_events", TRAFFIC_COLUMNS, rows)
+        except Exception:
+            # a rolled-back CREATE may have been cached above; re-check next time
+            for day in days:
+                _known_partitions.discard(partition_name(day))
+            raise
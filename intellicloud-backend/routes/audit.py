@@ -1,10 +1,12 @@
-import time, json, uuid, collections, queue
-from flask import Blueprint, Response, jsonify
+import time, uuid, collections
+from flask import Blueprint, Response, jsonify, request
+from services.backplane import broadcast
+from services.sse import FrameRing, SSE_HEADERS
 
 bp = Blueprint("audit", __name__)
 
 _log = collections.deque(maxlen=1000)
-_subs = set()
+_ring = FrameRing(capacity=1024)
 
 def log_event(actor: str, action: str, target: str, details: str):
     """Call from anywhere to append and broadcast"""
@@ -18,11 +20,7 @@ def log_event(actor: str, action: str, target: str, details: str):
     }
 
     _log.appendleft(ev)
-    dead = []
-    for q in list(_subs):
-        try: q.put_nowait(ev)
-        except Exception: dead.append(q)
-    for q in dead: _subs.discard(q)
+    broadcast("audit", _ring, ev)
     return ev
 
 
@@ -32,25 +30,5 @@ def list_recent():
 
 @bp.route("/stream/audit")
 def stream():
-    def event_stream():
-        q = queue.Queue()
-        _subs.add(q)
-        try:
-            # replay last 50
-            for ev in list(_log)[:50][::-1]:
-                yield f"data: {json.dumps(ev)}\n\n"
-            last_beat = 0.0
-            while True:
-                try:
-                    ev = q.get(timeout=1.0)
-                    yield f"data: {json.dumps(ev)}\n\n"
-                except queue.Empty:
-                    pass
-                now = time.time()
-                if now - last_beat >= 3.0:
-                    yield ": keep-alive\n\n"
-                    last_beat = now
-        finally:
-            _subs.discard(q)
-    headers = {"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
-    return Response(event_stream(), mimetype="text/event-stream", headers=headers)
\ No newline at end of file
+    # replay last 50
+    return Response(_ring.stream(replay=50, peer=request.remote_addr or ""), mimetype="text/event-stream", headers=SSE_HEADERS)
@@ -3,9 +3,13 @@ from werkzeug.exceptions import BadRequest
 from ipaddress import ip_address
 import psycopg2
 import os
-from models.db import get_db_connection, put_db_connection
-from models.tracker import log_visitor_ip           # raw IP visit log
-from services.detections import eval_event           # rule engine → alerts/threats
+from datetime import datetime
+from models.clients import resolve_client
+from models.tracker import log_visits_bulk          # raw IP visit log
+from services.detections import eval_events          # rule engine → alerts/threats
+from services.write_behind import WriteBehindBuffer
+from services.netclass import classifier
+from services.distinct import distinct
 
 collector_bp = Blueprint("collector", __name__, url_prefix="/api/collect")
 try:
@@ -16,47 +20,52 @@ except Exception:  # no limiter available; create a no-op decorator
         return deco
     limiter = type("NoLimiter", (), {"limit": staticmethod(_noop)})
 
-def _get_client_by_api_key(api_key: str):
+def _flush_visits(batch: list[dict]) -> None:
     """
-    Minimal direct lookup to avoid 'undefined' import errors.
-    Expects a 'clients' table with columns: client_id, client_name, api_key, domain, created_at
-    Returns a dict or None.
+    Write-behind flush: one COPY for the raw visit log, then one detection batch per client.
+    Raises when the visit log write comes up short so the buffer counts the batch as failed.
     """
-    conn = get_db_connection()
-    if conn is None:
-        return None
-    
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT client_id, client_name, api_key, domain, created_at
-                FROM clients
-                WHERE api_key = %s
-                LIMIT 1
-                """,
-                (api_key,),
-            )
-            row = cur.fetchone()
-            if not row:
-                return None
-            return {
-                "client_id": row["client_id"],
-                "client_name": row["client_name"],
-                "api_key": row["api_key"],
-                "domain": row["domain"],
-                "created_at": row["created_at"],
-            }
-    finally:
-        put_db_connection(conn)
+    written = log_visits_bulk([
+        {"ip": v["ip"], "user_agent": v["user_agent"], "client_id": v["client_id"], "timestamp": v["timestamp"]}
+        for v in batch
+    ])
+    distinct.add_many("visitors", ((v["client_id"], v["ip"], v["timestamp"]) for v in batch))
+    by_client: dict[int, list[dict]] = {}
+    for v in batch:
+        by_client.setdefault(v["client_id"], []).append({
+            "ip_address": v["ip"],
+            "user_agent": v["user_agent"],
+            "description": f"page={v['page']}" if v["page"] else "",
+            "threat_level": 0,   # initial; your rules can escalate
+        })
+    for client_id, events in by_client.items():
+        try:
+            eval_events(events, client_id)
+        except Exception as e:
+            # Detection errors should not break ingestion; just report
+            print("detections_failed:", e)
+    if written != len(batch):
+        # log_visits_bulk reports DB errors as 0 rows rather than raising
+        raise RuntimeError(f"visit log wrote {written} of {len(batch)} rows")
+
+visit_buffer = WriteBehindBuffer(
+    _flush_visits,
+    name="collector-visits",
+    max_items=int(os.getenv("COLLECT_BUFFER_MAX", "20000")),
+    batch_size=int(os.getenv("COLLECT_FLUSH_ROWS", "500")),
+    interval=float(os.getenv("COLLECT_FLUSH_SECS", "1.0")),
+)
 
 def _best_ip_from_request(req) -> str:
     """
-    Picks the right source IP. Handles common proxy headers.
+    Picks the right source IP. Handles common proxy headers: X-Forwarded-For
+    is walked right to left past our own (internal) proxy hops, so the first
+    external address wins; the leftmost entry is the fallback.
     """
     xff = req.headers.get("X-Forwarded-For")
     if xff:
-        ip = xff.split(",")[0].strip()
+        hops = [h.strip() for h in xff.split(",") if h.strip()]
+        ip = next((h for h in reversed(hops) if not classifier.is_internal(h)), hops[0] if hops else "")
     else:
         ip = req.headers.get("X-Real-IP") or req.remote_addr or ""
 
@@ -75,13 +84,16 @@ def collect_ip():
     Contract:
     - Header:   X-Client-Key: <client API key>
     - Body:     { "page": "https://example.com/path" }   (optional)
-    Response:     { ok: true, log: {...} }
+    Response:     202 { ok: true, queued: true }
+
+    The visit is only queued here; visit_buffer writes it and runs detections
+    in the background so the page view never waits on the database.
     """
     client_key = request.headers.get("X-Client-Key")
     if not client_key:
         return jsonify({"error": "missing_client_key"}), 400
 
-    client = _get_client_by_api_key(client_key)
+    client = resolve_client(client_key)
     if not client:
         return jsonify({"error": "invalid_client_key"}), 403
 
@@ -90,26 +102,17 @@ def collect_ip():
     payload = request.get_json(silent=True) or {}
     page = (payload.get("page") or "").strip()
 
-    # 1) raw log (for timeline/forensics)
-    try:
-        raw_log_row = log_visitor_ip(ip_address=ip, user_agent=ua, client_id=client["client_id"], page=page)
-    except Exception as e:
-        return jsonify({"error": "log_write_failed", "detail": str(e)}), 500
-
-    # 2) evaluate detections → alerts/threat rows
-    try:
-        event = {
-            "ip_address": ip,
-            "user_agent": ua,
-            "description": f"page={page}" if page else "",
-            "threat_level": 0,   # initial; your rules can escalate
-        }
-        eval_event(event, client["client_id"])
-    except Exception as e:
-        # Detection errors should not break ingestion; just report
-        return jsonify({"ok": True, "log": raw_log_row, "warn": f"detections_failed: {e}"}), 202
+    queued = visit_buffer.put({
+        "ip": ip,
+        "user_agent": ua,
+        "client_id": client["client_id"],
+        "page": page,
+        "timestamp": datetime.utcnow(),
+    })
+    if not queued:
+        return jsonify({"error": "ingest_backlogged"}), 503
 
-    return jsonify({"ok": True, "log": raw_log_row}), 201
+    return jsonify({"ok": True, "queued": True}), 202
 
 # Health-check for debugging
 @collector_bp.route("/_ping", methods=["GET"])
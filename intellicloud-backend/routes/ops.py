@@ -3,6 +3,14 @@ import time
 import socket
 import redis as _redis
 from services.geo import geo_status, load_readers
+from models.db import pool_stats
+from models.clients import client_cache_stats
+from services.blocklist import blocklist_stats
+from services.netclass import classifier
+from services.backplane import get_backplane
+from services.traffic_store import traffic_store_stats
+from services.distinct import distinct
+from services.scan_detector import scan_detector
 
 bp = Blueprint("ops", __name__)
 
@@ -45,8 +53,63 @@ def preflight():
     except Exception as e:
         payload["geo"]["error"] = (str(e) or e.__class__.__name__)[:200]
 
+    try:
+        payload["db_pool"] = pool_stats()
+    except Exception as e:
+        payload["db_pool"] = {"error": (str(e) or e.__class__.__name__)[:200]}
+
+    try:
+        payload["client_cache"] = client_cache_stats()
+    except Exception as e:
+        payload["client_cache"] = {"error": (str(e) or e.__class__.__name__)[:200]}
+
+    try:
+        payload["blocklist"] = blocklist_stats()
+    except Exception as e:
+        payload["blocklist"] = {"error": (str(e) or e.__class__.__name__)[:200]}
+
+    payload["netclass"] = classifier.stats()
+
+    try:
+        from routes.collector import visit_buffer
+        payload["collector_buffer"] = visit_buffer.stats()
+    except Exception as e:
+        payload["collector_buffer"] = {"error": (str(e) or e.__class__.__name__)[:200]}
+
+    payload["distinct"] = distinct.stats()
+    payload["scan_detector"] = scan_detector.stats()
+
+    try:
+        payload["traffic_store"] = traffic_store_stats()
+    except Exception as e:
+        payload["traffic_store"] = {"error": (str(e) or e.__class__.__name__)[:200]}
+
+    try:
+        from routes.traffic import ring as traffic_ring
+        from routes.audit import _ring as audit_ring
+        bp_ = get_backplane()
+        payload["streams"] = {
+            "traffic": traffic_ring.stats(),
+            "audit": audit_ring.stats(),
+            "backplane": bp_.stats() if bp_ else {"enabled": False},
+        }
+    except Exception as e:
+        payload["streams"] = {"error": (str(e) or e.__class__.__name__)[:200]}
+
     return jsonify(payload)
 
+@bp.get("/ops/streams")
+def streams():
+    """Per-subscriber lag and drop counters for every SSE stream in this worker."""
+    from routes.traffic import ring as traffic_ring
+    from routes.audit import _ring as audit_ring
+    bp_ = get_backplane()
+    return jsonify({
+        "traffic": traffic_ring.stats(detail=True),
+        "audit": audit_ring.stats(detail=True),
+        "backplane": bp_.stats() if bp_ else {"enabled": False},
+    })
+
 @bp.post("/ops/reload-geo")
 def reload_geo():
     old = current_app.extensions.get("geo") or current_app.config.get("GEO_READERS") or {}
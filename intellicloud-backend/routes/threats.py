@@ -1,16 +1,30 @@
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, Response, request, jsonify, g
 from extensions import limiter
 from auth import require_auth, require_role, verify_api
 from models.threats import (
     insert_threat, get_all_threats, delete_threat_by_id,
     update_threat_by_id, get_audit_logs, log_action,
-    get_threats_from_db, get_threats_for_user
+    get_threats_from_db, get_threats_for_user, insert_threats_bulk,
+    stream_threats, get_threat_for_user, MAX_PAGE_SIZE
 )
+from services.distinct import distinct, GRANULARITIES, SCOPES
+from services.traffic_stats import parse_window
 from datetime import datetime
+import os
+import json
+import time
 import re
+import threading
 
 threats_bp = Blueprint("threats_bp", __name__)
 
+EXTERNAL_LOG_MAX_BATCH = 10000
+UNIQUES_MAX_BUCKETS = 1000
+# every NDJSON stream pins a pooled DB connection for as long as its client reads,
+# so only a few may run at once; the rest get 503 instead of starving other routes
+THREATS_MAX_STREAMS = int(os.getenv("THREATS_MAX_STREAMS", "3"))
+_stream_slots = threading.BoundedSemaphore(THREATS_MAX_STREAMS)
+
 def is_valid_ipv4(ip: str) -> bool:
     if not isinstance(ip, str):
         return False
@@ -23,6 +37,59 @@ def is_valid_ipv4(ip: str) -> bool:
     except ValueError:
         return False
 
+def _page_args():
+    """Read ?after_id=&limit= keyset pagination args (limit clamped to MAX_PAGE_SIZE)."""
+    after_id = request.args.get("after_id", type=int)
+    limit = request.args.get("limit", type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return after_id, limit
+
+def _level_arg():
+    """Parse ?threat_level= as an int. Returns (level, error_response)."""
+    raw = request.args.get("threat_level")
+    if raw is None or raw == "":
+        return None, None
+    try:
+        return int(raw), None
+    except ValueError:
+        return None, (jsonify({"error": "threat_level must be an integer"}), 400)
+
+def _item_level(raw):
+    """threat_level of an /external-log batch item as an int, or None if the column can't take it."""
+    if raw is None:
+        return 0
+    if isinstance(raw, bool):
+        return None
+    try:
+        level = int(raw) if isinstance(raw, (int, str)) else None
+    except ValueError:
+        return None
+    return level if level is not None and -2**31 <= level < 2**31 else None
+
+def _wants_ndjson() -> bool:
+    return (
+        request.args.get("format") == "ndjson"
+        or "application/x-ndjson" in request.headers.get("Accept", "")
+    )
+
+def _ndjson_response(rows):
+    if not _stream_slots.acquire(blocking=False):
+        return jsonify({"error": "Too many concurrent streams, retry shortly"}), 503, {"Retry-After": "5"}
+    def generate():
+        for r in rows:
+            yield json.dumps(r, default=str) + "\n"
+    resp = Response(generate(), mimetype="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+    resp.call_on_close(_stream_slots.release)   # runs even if the client leaves before the first row
+    return resp
+
+def _page_response(items, limit):
+    """JSON array body; X-Next-After-Id carries the cursor for the next page when this one is full."""
+    resp = jsonify(items)
+    if limit is not None and len(items) == limit:
+        resp.headers["X-Next-After-Id"] = str(items[-1]["id"])
+    return resp, 200
+
 @threats_bp.route("/ping", methods=["GET"])
 @require_auth
 def ping():
@@ -32,9 +99,14 @@ def ping():
 def public_threats():
 
     ip = request.args.get("ip")
-    threat_level = request.args.get("threat_level")
-    data = get_threats_from_db(ip, threat_level)
-    return jsonify(data), 200
+    threat_level, err = _level_arg()
+    if err:
+        return err
+    after_id, limit = _page_args()
+    if _wants_ndjson():
+        return _ndjson_response(stream_threats(ip=ip, threat_level=threat_level, after_id=after_id))
+    data = get_threats_from_db(ip, threat_level, after_id=after_id, limit=limit)
+    return _page_response(data, limit)
 
 @threats_bp.route("/", methods=["GET"])
 @require_auth
@@ -43,21 +115,20 @@ def list_threats():
 
     uid = request.user["uid"]
     ip_filter = request.args.get("ip")
-    level_filter = request.args.get("threat_level")
-
-    items = get_threats_for_user(uid)
-
-    if ip_filter:
-        items = [t for t in items if t.get("ip_address") == ip_filter]
-
-    if level_filter is not None:
-        try:
-            level_int = int(level_filter)
-            items = [t for t in items if str(t.get("threat_level")) == str(level_int)]
-        except ValueError:
-            items = [t for t in items if str(t.get("threat_level")) == level_filter]
-
-    return jsonify(items), 200
+    level_filter, err = _level_arg()
+    if err:
+        return err
+    after_id, limit = _page_args()
+
+    if _wants_ndjson():
+        return _ndjson_response(stream_threats(
+            user_id=uid, ip=ip_filter, threat_level=level_filter, after_id=after_id
+        ))
+
+    items = get_threats_for_user(
+        uid, ip=ip_filter, threat_level=level_filter, after_id=after_id, limit=limit
+    )
+    return _page_response(items, limit)
 
 @threats_bp.route("/", methods=["POST"])
 @require_auth
@@ -107,10 +178,9 @@ def add_threat():
 def get_threat_by_id(threat_id):
 
     uid = request.user["uid"]
-    items = get_threats_for_user(uid)
-    for threat in items:
-        if threat.get("id") == threat_id:
-            return jsonify(threat), 200
+    threat = get_threat_for_user(uid, threat_id)
+    if threat:
+        return jsonify(threat), 200
     return jsonify({"error": "Threat not found"}), 404
 
 
@@ -155,16 +225,20 @@ def list_threats_for_client():
     client_id = g.client["client_id"]
 
     ip_filter = request.args.get("ip")
-    level_filter = request.args.get("threat_level")
-
-    items = get_threats_for_client(client_id)
-
-    if ip_filter:
-        items = [t for t in items if t.get("ip_address") == ip_filter]
-    if level_filter is not None:
-        items = [t for t in items if str(t.get("threat_level")) == str(level_filter)]
-
-    return jsonify(items), 200
+    level_filter, err = _level_arg()
+    if err:
+        return err
+    after_id, limit = _page_args()
+
+    if _wants_ndjson():
+        return _ndjson_response(stream_threats(
+            client_id=client_id, ip=ip_filter, threat_level=level_filter, after_id=after_id
+        ))
+
+    items = get_threats_for_client(
+        client_id, ip=ip_filter, threat_level=level_filter, after_id=after_id, limit=limit
+    )
+    return _page_response(items, limit)
 
 @threats_bp.route("/external-log", methods=["POST"])
 @verify_api
@@ -172,6 +246,9 @@ def list_threats_for_client():
 def external_log_ip():
 
     data = request.get_json(silent=True) or {}
+    if isinstance(data, list) or "items" in data:
+        return _external_log_batch(data if isinstance(data, list) else data.get("items"))
+
     ip = data.get("ip")
     threat_level = data.get("threat_level", "low")
     if not ip:
@@ -189,6 +266,64 @@ def external_log_ip():
     )
     return jsonify({"message": f"IP {ip} logged for {g.client['client_name']}"}), 201
 
+def _external_log_batch(items):
+    """Bulk form of /external-log: [{ip, threat_level?}, ...] or {"items": [...]}, written with COPY."""
+    if not isinstance(items, list):
+        return jsonify({"error": "items_must_be_list"}), 400
+    if len(items) > EXTERNAL_LOG_MAX_BATCH:
+        return jsonify({"error": f"Too many items (max {EXTERNAL_LOG_MAX_BATCH})"}), 413
+
+    client_id = g.client["client_id"]
+    now = datetime.utcnow()
+    rows, rejected = [], 0
+    for it in items:
+        ip = it.get("ip") if isinstance(it, dict) else None
+        level = _item_level(it.get("threat_level")) if ip else None
+        if not ip or not is_valid_ipv4(ip) or level is None:
+            rejected += 1
+            continue
+        rows.append({
+            "ip_address": ip,
+            "threat_level": level,
+            "description": "external-log",
+            "timestamp": now,
+            "client_id": client_id,
+        })
+
+    written = insert_threats_bulk(rows)
+    if rows and not written:
+        # the batch is one COPY; nothing written means the DB refused or was unreachable
+        return jsonify({"error": "Failed to log IPs", "logged": 0, "rejected": rejected}), 503
+    return jsonify({
+        "message": f"{written} IPs logged for {g.client['client_name']}",
+        "logged": written,
+        "rejected": rejected,
+    }), 201
+
+@threats_bp.route("/client/uniques", methods=["GET"])
+@verify_api
+def get_client_uniques():
+    """
+    Distinct IPs for this client from HyperLogLog sketches (~2% error).
+    ?scope=visitors|traffic  ?granularity=minute|hour  ?window=24h
+    """
+    scope = request.args.get("scope", "visitors")
+    granularity = request.args.get("granularity", "hour")
+    if scope not in SCOPES or granularity not in GRANULARITIES:
+        return jsonify({"error": f"scope must be one of {SCOPES}, granularity one of {tuple(GRANULARITIES)}"}), 400
+    step = GRANULARITIES[granularity]
+    try:
+        window = parse_window(request.args.get("window"), default=24 * 3600)
+    except ValueError:
+        return jsonify({"error": "window must look like 90m, 24h or 86400"}), 400
+    if window // step > UNIQUES_MAX_BUCKETS:
+        return jsonify({"error": f"window too long for {granularity} buckets (max {UNIQUES_MAX_BUCKETS})"}), 400
+
+    end = time.time()
+    out = distinct.count(scope, g.client["client_id"], step, end - window, end + step)
+    out.update({"scope": scope, "granularity": granularity, "window_secs": window})
+    return jsonify(out), 200
+
 @threats_bp.route("/client/meta", methods=["GET"])
 @verify_api
 def get_client_meta():
@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify
 from models.tracker import log_visitor_ip
-from models.db import get_db_connection
+from models.clients import resolve_client
 
 track_bp = Blueprint("track_bp", __name__, url_prefix="/api")
 
@@ -14,18 +14,13 @@ def track_ip():
     if not ip or not api_key:
         return jsonify({"error": "Missing ip or client_api_key"}), 400
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM client_keys WHERE api_key = %s;", (api_key,))
-    client = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    client = resolve_client(api_key)
 
     if not client:
         return jsonify({"error": "Invalid API key"}), 403
     
     try:
-        result = log_visitor_ip(ip, user_agent, client[0])
+        result = log_visitor_ip(ip, user_agent, client["client_id"])
         return jsonify({
             "message": "IP logged successfully",
             "log_id": result["id"],
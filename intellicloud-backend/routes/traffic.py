@@ -1,124 +1,49 @@
-import json, time, queue, collections, uuid, ipaddress
+import os
+import time
 from flask import Blueprint, Response, request, current_app
 from routes.audit import log_event
-from services.geo import enrich_pair
+from models.clients import resolve_client
+from models.traffic_events import event_ts
+from services.backplane import broadcast
+from services.sse import FrameRing, SSE_HEADERS
+from services.stream_filter import FilterError, compile_filter
+from services.ingest_decode import IngestDecodeError, chunked, iter_items
+from services.traffic_pipeline import normalize_batch
+from services.traffic_store import store_events
+from services.traffic_stats import traffic_stats, parse_window
+from services.distinct import distinct
+from services.scan_detector import scan_detector
 
 bp = Blueprint("traffic", __name__)
 
-last_event_ts = 0.0
-subscribers = set()
-backlog = collections.deque(maxlen=200)
-
-RFC1918 = [
-    ipaddress.ip_network("10.0.0.0/8"),
-    ipaddress.ip_network("172.16.0.0/12"),
-    ipaddress.ip_network("192.168.0.0/16"),
-]
-
-def _is_inside(ip: str) -> bool:
-    try:
-        obj = ipaddress.ip_address(ip)
-        if obj.is_loopback or obj.is_link_local:
-            return True
-        return any(obj in net for net in RFC1918)
-    except Exception:
-        return False
-
-def _to_int(x):
-    try: return int(x)
-    except: return None
+BACKLOG = 200
+# cap on a decoded body, so a small compressed request can't balloon in memory
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(64 << 20)))
+INGEST_CHUNK = int(os.getenv("INGEST_CHUNK", "1000"))
 
-def _infer_dir(src, dst):
-    if _is_inside(src) and not _is_inside(dst): return "outbound"
-    if not _is_inside(src) and _is_inside(dst): return "inbound"
-    if _is_inside(src) and _is_inside(dst):     return "internal"
-    return "external"
-
-def _score_level(norm):
-    suspicious = {22, 23, 25, 445, 3389, 5900, 1433}
-    proto = (norm.get("proto") or "").lower()
-    dport = norm.get("dport") or 0
-    return "High" if (proto == "tcp" and dport in suspicious) else "Low"
+last_event_ts = 0.0
+ring = FrameRing(capacity=4096)
 
 def _broadcast(ev: dict):
-    backlog.append(ev)
-    dead = []
-    for q in list(subscribers):
-        try:
-            q.put_nowait(ev)
-        except Exception:
-            dead.append(q)
-    for q in dead:
-        subscribers.discard(q)
+    broadcast("traffic", ring, ev)
 
 @bp.route("/stream/traffic")
 def stream():
-    def event_stream():
-        q = queue.Queue()
-        subscribers.add(q)
-        try:
-            for ev in list(backlog):
-                yield f"data: {json.dumps(ev)}\n\n"
-            last_beat = 0.0
-            while True:
-                try:
-                    ev = q.get(timeout=1.0)
-                    yield f"data: {json.dumps(ev)}\n\n"
-                except queue.Empty:
-                    pass
-                now = time.time()
-                if now - last_beat >= 3.0:
-                    yield ": keep-alive\n\n"
-                    last_beat = now
-        finally:
-            subscribers.discard(q)
-    headers = {
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "X-Accel-Buffering": "no",
-    }
-    return Response(event_stream(), mimetype="text/event-stream", headers=headers)
-
-@bp.route("/traffic/ingest", methods=["POST"])
-def ingest():
-    data = request.get_json(force=True, silent=True)
-    if data is None:
-        return {"error": "bad_json"}, 400
-    items = data if isinstance(data, list) else data.get("items", [])
-    if not isinstance(items, list):
-        return {"error": "items_must_be_list"}, 400
-
-    readers = (
-        current_app.extensions.get("geo")
-        or current_app.config.get("GEO_READERS")
-        or {}
-    )
+    # optional server-side filters, e.g. ?level=High&dir=inbound&dport=22,3389&src=10.0.0.0/8
+    try:
+        match = compile_filter(request.args.to_dict(flat=False))
+    except FilterError as e:
+        return {"error": "bad_filter", "detail": str(e)}, 400
+    return Response(ring.stream(replay=BACKLOG, match=match, peer=request.remote_addr or ""), mimetype="text/event-stream", headers=SSE_HEADERS)
 
+def _process(items: list, readers, client) -> int:
+    """Run one chunk of raw items through the pipeline; returns events accepted."""
     global last_event_ts
+    events = normalize_batch(items, readers)
     count = 0
-    for ev in items:
-        if not isinstance(ev, dict):
-            continue
-        norm = {
-            "eid": str(uuid.uuid4()),
-            "ts": ev.get("ts", time.time()),
-            "src": ev.get("src"),
-            "dst": ev.get("dst"),
-            "proto": ev.get("proto", "ip"),
-            "sport": _to_int(ev.get("sport")),
-            "dport": _to_int(ev.get("dport")),
-            "dns":  ev.get("dns") or "",
-        }
-        norm["dir"]   = _infer_dir(norm.get("src"), norm.get("dst"))
-        norm["level"] = _score_level(norm)
-
-        try:
-            s_geo, d_geo = enrich_pair(norm.get("src"), norm.get("dst"), readers)
-            if s_geo: norm["src_geo"] = s_geo
-            if d_geo: norm["dst_geo"] = d_geo
-        except Exception:
-            pass
-
+    for norm in events:
+        if client:
+            norm["client_id"] = client["client_id"]
         if norm["level"] == "High":
             tgt = f"{norm.get('src')}:{norm.get('sport')} -> {norm.get('dst')}:{norm.get('dport')}"
             det = f"{(norm.get('proto') or '').upper()}/{norm.get('dport')} classified High"
@@ -128,5 +53,71 @@ def ingest():
         last_event_ts = float(norm["ts"]) or time.time()
         count += 1
 
+    for f in scan_detector.observe(events):
+        what = "port scan" if f["kind"] == "port_scan" else "host sweep"
+        det = f"{what}: {f['ports']} ports across {f['hosts']} hosts in {f['window_secs']:g}s"
+        log_event(actor="detector", action="alert", target=f["src"], details=det)
+
+    traffic_stats.add_batch(events)
+    # one HLL add per (client, src, minute): the bucket comes from the event's own ts
+    seen = {}
+    for ev in events:
+        src = ev.get("src")
+        if not isinstance(src, str) or not src:
+            continue
+        ts = event_ts(ev)
+        seen.setdefault((ev.get("client_id"), src, int(ts // 60)), ts)
+    distinct.add_many("traffic", ((c, src, ts) for (c, src, _), ts in seen.items()))
+    store_events(events)   # persisted by a background thread
+    return count
+
+@bp.route("/traffic/ingest", methods=["POST"])
+def ingest():
+    """
+    Body formats (Content-Type): JSON {"items": [...]} or [...] (default),
+    NDJSON (application/x-ndjson, one event per line) or msgpack
+    (application/msgpack, a sequence of event maps). Content-Encoding may be
+    gzip or zstd. NDJSON and msgpack are decoded while the body streams in
+    and go through the pipeline INGEST_CHUNK events at a time; if the body
+    turns out to be bad halfway, the chunks before it are kept and the
+    error reports how many were received.
+    """
+    readers = (
+        current_app.extensions.get("geo")
+        or current_app.config.get("GEO_READERS")
+        or {}
+    )
+
+    # a sender that presents its client key gets its events tagged for ?client= stream filters
+    api_key = request.headers.get("X-Client-Key") or request.headers.get("x-api-key")
+    client = resolve_client(api_key) if api_key else None
+
+    count = 0
+    try:
+        items = iter_items(request.stream, request.mimetype, request.headers.get("Content-Encoding"), INGEST_MAX_BYTES)
+        for chunk in chunked(items, INGEST_CHUNK):
+            count += _process(chunk, readers, client)
+    except IngestDecodeError as e:
+        current_app.logger.info("Traffic ingest rejected after %s events: %s", count, e)
+        return {"error": e.code, "detail": str(e), "received": count}, e.status
     current_app.logger.info("Traffic ingest: %s events", count)
     return {"ok": True, "received": count}, 200
+
+@bp.get("/traffic/stats")
+def stats():
+    """
+    Top talkers / ports / countries over a recent window of ingest in this worker.
+    ?window=5m (s/m/h, up to the retention)  ?dims=src,dport  ?n=10 (max 100)
+    """
+    try:
+        window = parse_window(request.args.get("window"))
+        n = min(max(int(request.args.get("n", 10)), 1), 100)
+    except ValueError:
+        return {"error": "bad_request", "detail": "window must look like 90s, 5m or 1h; n must be an integer"}, 400
+    dims = [d.strip() for d in request.args.get("dims", "").split(",") if d.strip()] or None
+    unknown = [d for d in dims or [] if d not in traffic_stats.dims]
+    if unknown:
+        return {"error": "bad_request", "detail": f"unknown dims {unknown}; expected {list(traffic_stats.dims)}"}, 400
+    out = traffic_stats.top(window, dims, n)
+    out["as_of"] = time.time()
+    return out
@@ -0,0 +1,170 @@
+from __future__ import annotations
+import os
+import time
+import threading
+import collections
+from typing import Dict
+import redis as _redis
+from services.sse import FrameRing
+
+class RedisBackplane:
+    """
+    Shares SSE frames between gunicorn workers through Redis.
+
+    publish() queues an already-encoded frame; a publisher thread, woken when
+    the queue stops being empty, sends whatever has queued up in pipelined
+    batches (PUBLISH for live delivery plus XADD to a capped stream for
+    history). One subscriber thread per worker feeds every frame it receives,
+    including this worker's own, into the attached local FrameRing. On start
+    the ring is seeded from the stream so a fresh worker can replay recent
+    events. Frames pushed out of a full queue are counted as "dropped". While
+    Redis is unreachable publish() returns False and callers fall back to
+    their local ring.
+    """
+
+    def __init__(self, url: str, prefix: str = "intellicloud:sse", history: int = 1000,
+                 batch_size: int = 256, max_pending: int = 10000):
+        self.url = url
+        self.prefix = prefix
+        self.history = history
+        self.batch_size = batch_size
+        self._rings: Dict[str, FrameRing] = {}
+        self._pending = collections.deque(maxlen=max_pending)
+        self._cond = threading.Condition()
+        self._pid = None
+        self.connected = False
+        self._stats = {"published": 0, "received": 0, "batches": 0, "publish_errors": 0,
+                       "fallback_local": 0, "reconnects": 0, "dropped": 0}
+
+    def attach(self, name: str, ring: FrameRing) -> None:
+        self._rings[name] = ring
+
+    def channel(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def stream_key(self, name: str) -> str:
+        return f"{self.prefix}:{name}:log"
+
+    def start(self) -> None:
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pending.clear()
+            self.connected = False
+        threading.Thread(target=self._subscribe_forever, name="sse-backplane-sub", daemon=True).start()
+        threading.Thread(target=self._publish_forever, name="sse-backplane-pub", daemon=True).start()
+
+    def publish(self, name: str, frame: str) -> bool:
+        if not self.connected or self._pid != os.getpid():
+            return False
+        with self._cond:
+            if len(self._pending) == self._pending.maxlen:
+                self._stats["dropped"] += 1   # append pushes the oldest frame out
+            self._pending.append((name, frame))
+            if len(self._pending) == 1:
+                self._cond.notify()           # publisher only sleeps while the queue is empty
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            out["pending"] = len(self._pending)
+        out["connected"] = self.connected
+        out["channels"] = sorted(self._rings)
+        return out
+
+    def _publish_forever(self) -> None:
+        client = _redis.from_url(self.url, decode_responses=True, socket_timeout=2)
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                n = min(len(self._pending), self.batch_size)
+                batch = [self._pending.popleft() for _ in range(n)]
+            try:
+                pipe = client.pipeline(transaction=False)
+                for name, frame in batch:
+                    pipe.publish(self.channel(name), frame)
+                    pipe.xadd(self.stream_key(name), {"f": frame}, maxlen=self.history, approximate=True)
+                pipe.execute()
+                with self._cond:
+                    self._stats["published"] += len(batch)
+                    self._stats["batches"] += 1
+            except Exception as e:
+                print("[backplane] publish failed:", e)
+                # don't lose the batch: deliver to this worker's own subscribers
+                for name, frame in batch:
+                    ring = self._rings.get(name)
+                    if ring:
+                        ring.publish_frame(frame)
+                with self._cond:
+                    self._stats["publish_errors"] += len(batch)
+                    self._stats["fallback_local"] += len(batch)
+                time.sleep(0.5)
+
+    def _seed(self, client) -> None:
+        for name, ring in self._rings.items():
+            if ring.seq:
+                continue
+            entries = client.xrevrange(self.stream_key(name), count=min(self.history, ring.capacity))
+            for _, fields in reversed(entries):
+                frame = fields.get("f")
+                if frame:
+                    ring.publish_frame(frame)
+
+    def _subscribe_forever(self) -> None:
+        by_channel = {self.channel(name): ring for name, ring in self._rings.items()}
+        while True:
+            pubsub = None
+            try:
+                client = _redis.from_url(self.url, decode_responses=True, socket_keepalive=True)
+                self._seed(client)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(*by_channel)
+                self.connected = True
+                for msg in pubsub.listen():
+                    ring = by_channel.get(msg.get("channel"))
+                    if ring and msg.get("type") == "message":
+                        ring.publish_frame(msg["data"])
+                        self._stats["received"] += 1
+            except Exception as e:
+                print("[backplane] subscriber error:", e)
+            finally:
+                self.connected = False
+                try:
+                    if pubsub:
+                        pubsub.close()
+                except Exception:
+                    pass
+            with self._cond:
+                self._stats["reconnects"] += 1
+            time.sleep(2.0)
+
+_backplane: RedisBackplane | None = None
+
+def get_backplane() -> RedisBackplane | None:
+    """The process-wide backplane, or None unless SSE_BACKPLANE=redis."""
+    global _backplane
+    if _backplane is None and os.getenv("SSE_BACKPLANE", "").lower() == "redis":
+        _backplane = RedisBackplane(
+            os.getenv("REDIS_URL", "redis://redis:6379/0"),
+            history=int(os.getenv("SSE_BACKPLANE_HISTORY", "1000")),
+        )
+    return _backplane
+
+def broadcast(name: str, ring: FrameRing, ev: dict) -> None:
+    """Encode once, then publish through the backplane when it's up, else straight to the local ring."""
+    frame = ring.encode(ev)
+    bp = get_backplane()
+    if bp is None or not bp.publish(name, frame):
+        ring.publish_frame(frame)
+
+def init_backplane(rings: Dict[str, FrameRing]) -> RedisBackplane | None:
+    bp = get_backplane()
+    if bp is None:
+        return None
+    for name, ring in rings.items():
+        bp.attach(name, ring)
+    bp.start()
+    return bp
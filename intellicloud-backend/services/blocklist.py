@@ -0,0 +1,106 @@
+import os
+import time
+import select
+import threading
+from models.alerts import block_ip, block_ips_bulk, load_blocklist, BLOCKLIST_CHANNEL
+from models.db import get_db_connection
+from services.cidr import CidrSet
+
+RELOAD_SECS = float(os.getenv("BLOCKLIST_RELOAD_SECS", "300"))
+RETRY_SECS = 5.0
+
+_index = CidrSet()
+_state = {"loaded_at": None, "reloads": 0, "notifications": 0, "listening": False, "pid": None}
+_state_lock = threading.Lock()
+
+def is_blocked(ip: str) -> bool:
+    """O(log n) exact-IP or CIDR membership check; never touches the database."""
+    return _index.contains(ip or "")
+
+def block(client_id: int | None, ip: str, reason: str) -> None:
+    """Persist a block and make it visible to this worker immediately."""
+    block_ip(client_id, ip, reason)
+    _index.add(ip)
+
+def mark_blocked(ip: str) -> None:
+    """Add to this worker's index only; the caller persists it (see block_many)."""
+    _index.add(ip)
+
+def block_many(rows: list[tuple]) -> None:
+    """rows: (client_id, ip, reason). One upsert for the lot, then visible locally."""
+    block_ips_bulk(rows)
+    _index.add_many(ip for _, ip, _ in rows)
+
+def reload() -> bool:
+    entries = load_blocklist()
+    if entries is None:
+        return False
+    bad = _index.replace(entries)
+    if bad:
+        print(f"[blocklist] skipped {bad} unparseable entries")
+    with _state_lock:
+        _state["loaded_at"] = time.time()
+        _state["reloads"] += 1
+    return True
+
+def init_blocklist() -> None:
+    """
+    Load ip_blocklist into this worker's index and start its LISTEN thread
+    (idempotent per process). block_ip() NOTIFYs every worker of new rows;
+    the listener also reloads the whole table every BLOCKLIST_RELOAD_SECS and
+    after reconnecting, so notifications missed while disconnected are picked up.
+    """
+    with _state_lock:
+        if _state["pid"] == os.getpid():
+            return
+        _state["pid"] = os.getpid()
+    reload()
+    threading.Thread(target=_listen_forever, name="blocklist-listener", daemon=True).start()
+
+def blocklist_stats() -> dict:
+    with _state_lock:
+        out = dict(_state)
+    out.pop("pid", None)
+    out.update(_index.stats())
+    return out
+
+def _listen_forever() -> None:
+    while True:
+        conn = get_db_connection()
+        if conn:
+            try:
+                _listen(conn)
+            except Exception as e:
+                print("[blocklist] listener error:", e)
+            finally:
+                with _state_lock:
+                    _state["listening"] = False
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        time.sleep(RETRY_SECS)
+
+def _listen(conn) -> None:
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"LISTEN {BLOCKLIST_CHANNEL}")
+    with _state_lock:
+        _state["listening"] = True
+    reload()
+    last_reload = time.monotonic()
+
+    while True:
+        timeout = max(0.0, RELOAD_SECS - (time.monotonic() - last_reload))
+        ready, _, _ = select.select([conn], [], [], timeout)
+        if ready:
+            conn.poll()
+            while conn.notifies:
+                note = conn.notifies.pop(0)
+                if note.payload:
+                    _index.add(note.payload)
+                with _state_lock:
+                    _state["notifications"] += 1
+        if time.monotonic() - last_reload >= RELOAD_SECS:
+            reload()
+            last_reload = time.monotonic()
@@ -0,0 +1,230 @@
+from __future__ import annotations
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import time
+from typing import Any, Dict, Iterator, List
+
+# tshark -T fields columns the collectors understand, in the order they ask for them
+FIELDS = [
+    "frame.time_epoch", "frame.len",
+    "ip.src", "ip.dst",
+    "ipv6.src", "ipv6.dst",
+    "tcp.srcport", "tcp.dstport",
+    "udp.srcport", "udp.dstport",
+    "tcp.flags.syn", "tcp.flags.ack",
+    "dns.qry.name",
+]
+
+def header_index(line: str) -> Dict[str, int]:
+    return {name: i for i, name in enumerate(line.strip().split(","))}
+
+def _col(name: str, cols: List[str], index: Dict[str, int]) -> str:
+    i = index.get(name, -1)
+    if i < 0 or i >= len(cols):
+        return ""
+    return cols[i]
+
+def parse_row(cols: List[str], index: Dict[str, int]) -> Dict[str, Any] | None:
+    """One tshark CSV row -> raw ingest event, or None when it has no IP endpoints."""
+    try:
+        ts = float(_col("frame.time_epoch", cols, index) or time.time())
+    except ValueError:
+        ts = time.time()
+
+    src = _col("ip.src", cols, index) or _col("ipv6.src", cols, index)
+    dst = _col("ip.dst", cols, index) or _col("ipv6.dst", cols, index)
+    if not (src and dst):
+        return None
+
+    t_s, t_d = _col("tcp.srcport", cols, index), _col("tcp.dstport", cols, index)
+    u_s, u_d = _col("udp.srcport", cols, index), _col("udp.dstport", cols, index)
+
+    try:
+        sport = int(t_s or u_s) if (t_s or u_s) else None
+    except ValueError:
+        sport = None
+
+    try:
+        dport = int(t_d or u_d) if (t_d or u_d) else None
+    except ValueError:
+        dport = None
+
+    ev: Dict[str, Any] = {
+        "ts": ts,
+        "src": src,
+        "dst": dst,
+        "proto": "tcp" if (t_s or t_d) else ("udp" if (u_s or u_d) else "ip"),
+        "sport": sport,
+        "dport": dport,
+        "syn": _col("tcp.flags.syn", cols, index) == "1",
+        "ack": _col("tcp.flags.ack", cols, index) == "1",
+    }
+
+    dns = _col("dns.qry.name", cols, index)
+    if dns:
+        ev["dns"] = dns
+    try:
+        ev["len"] = int(_col("frame.len", cols, index))
+    except ValueError:
+        pass
+    return ev
+
+def iter_csv(path: str, start: int = 0, end: int | None = None) -> Iterator[Dict[str, Any]]:
+    """
+    Events from the tshark CSV rows that *start* inside byte range [start, end),
+    so a big export can be split into ranges and read in parallel without
+    losing or repeating a line. The header is always read from line one.
+    """
+    with open(path, "rb") as f:
+        index = header_index(f.readline().decode("utf-8", "replace"))
+        pos = f.tell()
+        if start > pos:
+            f.seek(start - 1)
+            pos = start - 1 + len(f.readline())   # finish the line that straddles `start`
+        for line in f:
+            if end is not None and pos >= end:
+                break
+            pos += len(line)
+            text = line.decode("utf-8", "replace").strip()
+            if text:
+                ev = parse_row(text.split(","), index)
+                if ev is not None:
+                    yield ev
+
+# --- pcap ---------------------------------------------------------------------
+
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6), b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9), b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+PCAPNG_MAGIC = b"\x0a\x0d\x0d\x0a"
+_V6_EXT = {0, 43, 60}   # hop-by-hop, routing, destination options
+
+def is_pcap(path: str) -> bool:
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    return magic in PCAP_MAGIC or magic == PCAPNG_MAGIC
+
+def _ip_offset(linktype: int, data: bytes, order: str) -> int:
+    """Offset of the IP header in a frame, or -1 for non-IP frames."""
+    if linktype == 1:                                   # Ethernet (+ 802.1Q/QinQ tags)
+        off, etype = 14, data[12:14]
+        while etype in (b"\x81\x00", b"\x88\xa8") and len(data) >= off + 4:
+            etype = data[off + 2:off + 4]
+            off += 4
+        return off if etype in (b"\x08\x00", b"\x86\xdd") else -1
+    if linktype == 113:                                 # Linux cooked (SLL)
+        return 16 if data[14:16] in (b"\x08\x00", b"\x86\xdd") else -1
+    if linktype == 276:                                 # Linux cooked v2
+        return 20 if data[0:2] in (b"\x08\x00", b"\x86\xdd") else -1
+    if linktype in (12, 101, 228, 229):                 # raw IP
+        return 0
+    if linktype == 0 and len(data) >= 4:                # BSD loopback, host byte order
+        family = struct.unpack(order + "I", data[:4])[0]
+        return 4 if family in (2, 24, 28, 30) else -1
+    return -1
+
+def _dns_qname(payload: bytes) -> str | None:
+    # first question of a DNS message; names in the question section aren't compressed
+    if len(payload) < 13 or not int.from_bytes(payload[4:6], "big"):
+        return None
+    labels, i = [], 12
+    while i < len(payload):
+        n = payload[i]
+        if n == 0:
+            return ".".join(labels) or None
+        if n & 0xC0 or i + 1 + n > len(payload):
+            return None
+        labels.append(payload[i + 1:i + 1 + n].decode("ascii", "replace"))
+        i += 1 + n
+    return None
+
+def parse_frame(data: bytes, linktype: int, order: str = "<") -> Dict[str, Any] | None:
+    """Link-layer frame -> raw ingest event (same shape as parse_row), or None."""
+    off = _ip_offset(linktype, data, order)
+    if off < 0 or len(data) < off + 20:
+        return None
+    version = data[off] >> 4
+    if version == 4:
+        ihl = (data[off] & 0x0F) * 4
+        proto = data[off + 9]
+        src = socket.inet_ntop(socket.AF_INET, data[off + 12:off + 16])
+        dst = socket.inet_ntop(socket.AF_INET, data[off + 16:off + 20])
+        fragment = int.from_bytes(data[off + 6:off + 8], "big") & 0x1FFF
+        l4 = off + ihl if not fragment else -1
+    elif version == 6 and len(data) >= off + 40:
+        proto = data[off + 6]
+        src = socket.inet_ntop(socket.AF_INET6, data[off + 8:off + 24])
+        dst = socket.inet_ntop(socket.AF_INET6, data[off + 24:off + 40])
+        l4 = off + 40
+        while proto in _V6_EXT and len(data) >= l4 + 8:
+            proto, l4 = data[l4], l4 + (data[l4 + 1] + 1) * 8
+        if proto == 44 and len(data) >= l4 + 8:          # fragment header: only the first piece has ports
+            first = not int.from_bytes(data[l4 + 2:l4 + 4], "big") >> 3
+            proto, l4 = data[l4], (l4 + 8 if first else -1)
+    else:
+        return None
+
+    ev: Dict[str, Any] = {"src": src, "dst": dst, "proto": "ip", "sport": None, "dport": None,
+                          "syn": False, "ack": False}
+    if proto == 6 and l4 >= 0 and len(data) >= l4 + 14:
+        ev["proto"] = "tcp"
+        ev["sport"], ev["dport"] = struct.unpack(">HH", data[l4:l4 + 4])
+        flags = data[l4 + 13]
+        ev["syn"], ev["ack"] = bool(flags & 0x02), bool(flags & 0x10)
+    elif proto == 17 and l4 >= 0 and len(data) >= l4 + 8:
+        ev["proto"] = "udp"
+        ev["sport"], ev["dport"] = struct.unpack(">HH", data[l4:l4 + 4])
+        if 53 in (ev["sport"], ev["dport"]):
+            qname = _dns_qname(data[l4 + 8:])
+            if qname:
+                ev["dns"] = qname
+    return ev
+
+def iter_pcap(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Events from a classic libpcap file. pcapng (or anything else tshark can
+    read) goes through `tshark -r` when tshark is on PATH.
+    """
+    with open(path, "rb") as f:
+        head = f.read(24)
+        if head[:4] not in PCAP_MAGIC or len(head) < 24:
+            if head[:4] == PCAPNG_MAGIC:
+                yield from iter_tshark(path)
+                return
+            raise ValueError(f"{path}: not a pcap file")
+        order, unit = PCAP_MAGIC[head[:4]]
+        linktype = struct.unpack(order + "I", head[20:24])[0] & 0x0FFFFFFF
+        rec = struct.Struct(order + "IIII")
+        while True:
+            hdr = f.read(16)
+            if len(hdr) < 16:
+                return
+            sec, frac, caplen, origlen = rec.unpack(hdr)
+            data = f.read(caplen)
+            if len(data) < caplen:
+                return                                  # truncated capture
+            ev = parse_frame(data, linktype, order)
+            if ev is not None:
+                ev["ts"] = sec + frac * unit
+                ev["len"] = origlen
+                yield ev
+
+def iter_tshark(path: str) -> Iterator[Dict[str, Any]]:
+    tshark = shutil.which(os.getenv("TSHARK", "tshark"))
+    if not tshark:
+        raise RuntimeError(f"{path}: pcapng needs tshark on PATH (or convert it: editcap -F pcap in.pcapng out.pcap)")
+    cmd = [tshark, "-r", path, "-T", "fields", "-E", "header=y", "-E", "separator=,"]
+    for name in FIELDS:
+        cmd += ["-e", name]
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True) as proc:
+        index = header_index(proc.stdout.readline())
+        for line in proc.stdout:
+            line = line.strip()
+            if line:
+                ev = parse_row(line.split(","), index)
+                if ev is not None:
+                    yield ev
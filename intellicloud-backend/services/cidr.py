@@ -0,0 +1,141 @@
+from __future__ import annotations
+import bisect
+import ipaddress
+import threading
+from typing import Iterable, List, Tuple
+
+Interval = Tuple[int, int]
+
+def cidr_interval(cidr: str) -> Tuple[int, int, int]:
+    """'10.0.0.0/8' or a bare address -> (version, first, last) as integers."""
+    net = ipaddress.ip_network(str(cidr).strip(), strict=False)
+    return net.version, int(net.network_address), int(net.broadcast_address)
+
+def ip_to_int(ip: str) -> Tuple[int, int] | None:
+    """'1.2.3.4' -> (4, 16909060); None for anything that isn't an IP address."""
+    try:
+        addr = ipaddress.ip_address(ip.strip() if isinstance(ip, str) else ip)
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return addr.version, int(addr)
+
+def _merge(intervals: List[Interval]) -> Tuple[tuple, tuple]:
+    intervals.sort()
+    starts: List[int] = []
+    ends: List[int] = []
+    for lo, hi in intervals:
+        if ends and lo <= ends[-1] + 1:
+            if hi > ends[-1]:
+                ends[-1] = hi
+        else:
+            starts.append(lo)
+            ends.append(hi)
+    return tuple(starts), tuple(ends)
+
+class CidrSet:
+    """
+    Set of IPv4/IPv6 networks kept as sorted, merged integer intervals per
+    address family. Membership is a bisect over the interval starts, O(log n).
+    Readers never lock: writers build new tuples and swap them in.
+    """
+
+    def __init__(self, cidrs: Iterable[str] = ()):
+        self._lock = threading.Lock()
+        self._v4: Tuple[tuple, tuple] = ((), ())
+        self._v6: Tuple[tuple, tuple] = ((), ())
+        self._count = 0
+        self.replace(cidrs)
+
+    def replace(self, cidrs: Iterable[str]) -> int:
+        """Swap in a new set of networks. Unparseable entries are skipped; returns how many were."""
+        v4: List[Interval] = []
+        v6: List[Interval] = []
+        bad = 0
+        for c in cidrs:
+            try:
+                version, lo, hi = cidr_interval(c)
+            except ValueError:
+                bad += 1
+                continue
+            (v4 if version == 4 else v6).append((lo, hi))
+        with self._lock:
+            self._v4 = _merge(v4)
+            self._v6 = _merge(v6)
+            self._count = len(v4) + len(v6)
+        return bad
+
+    def add(self, cidr: str) -> bool:
+        """Add one network; False if `cidr` is not a valid address or network."""
+        try:
+            version, lo, hi = cidr_interval(cidr)
+        except ValueError:
+            return False
+        with self._lock:
+            starts, ends = self._v4 if version == 4 else self._v6
+            i = bisect.bisect_right(starts, lo) - 1
+            if i >= 0 and hi <= ends[i]:
+                return True   # already covered
+            # neighbours [j, k) overlap or touch [lo, hi]; they collapse into one interval
+            j = i if i >= 0 and ends[i] + 1 >= lo else i + 1
+            k = bisect.bisect_right(starts, hi + 1)
+            if j < k:
+                lo, hi = min(lo, starts[j]), max(hi, ends[k - 1])
+            merged = (starts[:j] + (lo,) + starts[k:], ends[:j] + (hi,) + ends[k:])
+            if version == 4:
+                self._v4 = merged
+            else:
+                self._v6 = merged
+            self._count += 1
+        return True
+
+    def add_many(self, cidrs: Iterable[str]) -> int:
+        """Add a batch with one merge per address family. Returns how many entries were invalid."""
+        new = {4: [], 6: []}
+        bad = 0
+        for c in cidrs:
+            try:
+                version, lo, hi = cidr_interval(c)
+            except ValueError:
+                bad += 1
+                continue
+            new[version].append((lo, hi))
+        if not new[4] and not new[6]:
+            return bad
+        with self._lock:
+            if new[4]:
+                self._v4 = _merge(list(zip(*self._v4)) + new[4])
+            if new[6]:
+                self._v6 = _merge(list(zip(*self._v6)) + new[6])
+            self._count += len(new[4]) + len(new[6])
+        return bad
+
+    def contains(self, ip: str) -> bool:
+        parsed = ip_to_int(ip)
+        if parsed is None:
+            return False
+        return self.contains_int(*parsed)
+
+    def contains_int(self, version: int, value: int) -> bool:
+        starts, ends = self._v4 if version == 4 else self._v6
+        return self._contains(starts, ends, value)
+
+    __contains__ = contains
+
+    @staticmethod
+    def _contains(starts: tuple, ends: tuple, value: int) -> bool:
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= ends[i]
+
+    def intervals(self, version: int) -> Tuple[tuple, tuple]:
+        """(starts, ends) for one address family, e.g. for vectorized lookups."""
+        return self._v4 if version == 4 else self._v6
+
+    def __len__(self) -> int:
+        return self._count
+
+    def stats(self) -> dict:
+        return {
+            "entries": self._count,
+            "v4_ranges": len(self._v4[0]),
+            "v6_ranges": len(self._v6[0]),
+        }
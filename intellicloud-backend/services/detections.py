@@ -1,13 +1,180 @@
-import re, yaml
-from models.alerts import create_alert, block_ip, is_ip_blocked
+import os, re, bisect, yaml
+from models.alerts import create_alerts_bulk
+from services.blocklist import block_many, is_blocked, mark_blocked
+from services.netclass import classifier
+
+RULES_PATH = os.getenv(
+    "RULES_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rules", "rules.yaml"),
+)
+
+CONDITIONS = ("threat_level_gte", "ua_regex", "ip_in_blocklist", "ip_internal")
+ACTIONS = ("log", "notify", "block_ip")
 
 _rules_cache = None
 
-def load_rules(path: str = "rules/rules.yaml"):
+class RuleError(ValueError):
+    """rules.yaml failed validation; the message lists every problem found."""
+
+def _threat_level(event: dict) -> int:
+    try:
+        return int(event.get("threat_level", 0) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+class Rule:
+    """
+    One compiled rule. `checks` are (name, predicate) pairs ordered cheapest
+    first; matches() stops at the first one that fails.
+    """
+    __slots__ = ("id", "severity", "title", "actions", "order",
+                 "level_gte", "ua_re", "in_blocklist", "internal", "checks")
+
+    def __init__(self, raw: dict, order: int):
+        cond = raw.get("when") or {}
+        self.id = str(raw["id"])
+        self.severity = str(raw["severity"])
+        self.title = str(raw["title"])
+        self.actions = tuple(a["type"] for a in raw.get("actions") or [])
+        self.order = order
+        self.level_gte = int(cond["threat_level_gte"]) if "threat_level_gte" in cond else None
+        self.ua_re = re.compile(cond["ua_regex"], re.I) if "ua_regex" in cond else None
+        self.in_blocklist = bool(cond["ip_in_blocklist"]) if "ip_in_blocklist" in cond else None
+        self.internal = bool(cond["ip_internal"]) if "ip_internal" in cond else None
+
+        checks = []
+        if self.level_gte is not None:
+            checks.append(("threat_level_gte", lambda ev, n=self.level_gte: _threat_level(ev) >= n))
+        if self.internal is not None:
+            checks.append(("ip_internal",
+                           lambda ev, want=self.internal: classifier.is_internal(ev.get("ip_address") or "") == want))
+        if self.ua_re is not None:
+            checks.append(("ua_regex", lambda ev, rx=self.ua_re: rx.search(ev.get("user_agent") or "") is not None))
+        if self.in_blocklist is not None:
+            checks.append(("ip_in_blocklist",
+                           lambda ev, want=self.in_blocklist: is_blocked(ev.get("ip_address") or "") == want))
+        self.checks = tuple(checks)
+
+    def matches(self, event: dict) -> bool:
+        for _, check in self.checks:
+            if not check(event):
+                return False
+        return True
+
+    def __repr__(self):
+        return f"Rule({self.id!r})"
+
+class RuleSet:
+    """
+    Compiled rules.yaml. Rules are bucketed by their cheapest selective
+    condition so an event only runs the rules that could fire for it:
+    - rules with ua_regex sit behind one combined alternation of all UA patterns
+    - rules with threat_level_gte are sorted by threshold and cut with bisect
+    - anything else is always evaluated
+    """
+
+    def __init__(self, rules: list[Rule]):
+        self.rules = tuple(rules)
+        ua_rules = [r for r in rules if r.ua_re is not None]
+        level_rules = sorted(
+            (r for r in rules if r.ua_re is None and r.level_gte is not None),
+            key=lambda r: r.level_gte,
+        )
+        self._ua_rules = tuple(ua_rules)
+        self._ua_gate = self._combine([r.ua_re for r in ua_rules])
+        self._level_rules = tuple(level_rules)
+        self._level_keys = tuple(r.level_gte for r in level_rules)
+        self._other_rules = tuple(r for r in rules if r.ua_re is None and r.level_gte is None)
+
+    @staticmethod
+    def _combine(patterns: list[re.Pattern]):
+        if not patterns:
+            return None
+        try:
+            return re.compile("|".join(f"(?:{p.pattern})" for p in patterns), re.I)
+        except re.error:
+            return None   # e.g. inline flags or clashing group names; fall back to per-rule regexes
+
+    def candidates(self, event: dict) -> list[Rule]:
+        """Rules whose selective condition can hold for `event`, in file order."""
+        out = list(self._other_rules)
+        if self._level_rules:
+            n = bisect.bisect_right(self._level_keys, _threat_level(event))
+            out.extend(self._level_rules[:n])
+        if self._ua_rules:
+            ua = event.get("user_agent") or ""
+            if self._ua_gate is None or self._ua_gate.search(ua):
+                out.extend(self._ua_rules)
+        out.sort(key=lambda r: r.order)
+        return out
+
+    def match(self, event: dict) -> list[Rule]:
+        return [r for r in self.candidates(event) if r.matches(event)]
+
+    def __len__(self):
+        return len(self.rules)
+
+def compile_rules(raw) -> RuleSet:
+    """Validate parsed rules.yaml and compile it. Raises RuleError listing every problem."""
+    if raw is None:
+        raw = []
+    if not isinstance(raw, list):
+        raise RuleError("rules file must contain a list of rules")
+
+    errors, rules, seen = [], [], set()
+    for i, r in enumerate(raw):
+        where = f"rule #{i + 1}"
+        if not isinstance(r, dict):
+            errors.append(f"{where}: expected a mapping"); continue
+        where = f"rule {r.get('id', '#' + str(i + 1))!r}"
+        problems = []
+        for key in ("id", "severity", "title"):
+            if not r.get(key):
+                problems.append(f"missing '{key}'")
+        if r.get("id") in seen:
+            problems.append("duplicate id")
+        cond = r.get("when") or {}
+        if not isinstance(cond, dict):
+            problems.append("'when' must be a mapping"); cond = {}
+        for key in cond:
+            if key not in CONDITIONS:
+                problems.append(f"unknown condition '{key}' (expected one of {', '.join(CONDITIONS)})")
+        if "threat_level_gte" in cond:
+            try:
+                int(cond["threat_level_gte"])
+            except (TypeError, ValueError):
+                problems.append("threat_level_gte must be an integer")
+        if "ua_regex" in cond:
+            try:
+                re.compile(cond["ua_regex"], re.I)
+            except (re.error, TypeError) as e:
+                problems.append(f"ua_regex does not compile: {e}")
+        for key in ("ip_in_blocklist", "ip_internal"):
+            if key in cond and not isinstance(cond[key], bool):
+                problems.append(f"{key} must be true or false")
+        actions = r.get("actions") or []
+        if not isinstance(actions, list):
+            problems.append("'actions' must be a list"); actions = []
+        for a in actions:
+            t = a.get("type") if isinstance(a, dict) else None
+            if t not in ACTIONS:
+                problems.append(f"unknown action {t!r} (expected one of {', '.join(ACTIONS)})")
+
+        if problems:
+            errors.extend(f"{where}: {p}" for p in problems)
+            continue
+        seen.add(r["id"])
+        rules.append(Rule(r, order=i))
+
+    if errors:
+        raise RuleError("invalid rules:\n  " + "\n  ".join(errors))
+    return RuleSet(rules)
+
+def load_rules(path: str | None = None, reload: bool = False) -> RuleSet:
     global _rules_cache
-    if _rules_cache is None:
-        with open(path, "r", encoding="utf-8") as f:
-            _rules_cache = yaml.safe_load(f) or []
+    if _rules_cache is None or reload:
+        with open(path or RULES_PATH, "r", encoding="utf-8") as f:
+            _rules_cache = compile_rules(yaml.safe_load(f))
     return _rules_cache
 
 def eval_event(event: dict, client_id: int | None) -> list[int]:
@@ -15,43 +182,46 @@ def eval_event(event: dict, client_id: int | None) -> list[int]:
     TO BE EXPECTED: ip_address, threat_level, user_agent, description, etc.
     Returns list of alert IDs created.
     """
+    return eval_events([event], client_id)[0]
+
+def eval_events(events: list[dict], client_id: int | None) -> list[list[int]]:
+    """
+    Evaluate a batch of events for one client. All matching alerts are written
+    with one multi-row INSERT and all block_ip actions with one upsert;
+    blocklist membership comes from the in-memory index, so the whole batch
+    costs at most two round-trips. Returns the created alert ids per event.
+    An ip blocked by an earlier event in the batch counts as blocked for later ones.
+    """
     rules = load_rules()
-    created = []
+    alert_rows: list[tuple] = []
+    owners: list[int] = []
+    notify: list[tuple[int, str]] = []
+    blocks: dict[str, tuple] = {}
 
-    for rule in rules:
-        cond = rule.get("when", {})
-        ok = True
+    for i, event in enumerate(events):
+        for rule in rules.match(event):
+            alert_rows.append((client_id, rule.id, rule.severity, rule.title, event))
+            owners.append(i)
+            for t in rule.actions:
+                if t == "block_ip":
+                    ip = event.get("ip_address")
+                    if ip and ip not in blocks:
+                        blocks[ip] = (client_id, ip, f"rule{rule.id}")
+                        mark_blocked(ip)
+                elif t == "notify":
+                    notify.append((len(alert_rows) - 1, rule.id))
 
-        if "threat)level_gte" in cond:
-            ok &= int(event.get("threat_level", 0)) >= int(cond["threat_level_gtc"])
-        if "ua_regex" in cond:
-            ua = event.get("user_agent", "") or ""
-            ok &= bool(re.search(cond["ua_regex"], ua, re.I))
-        if cond.get("ip_in_blocklist") is False:
-            ok &= not is_ip_blocked(event.get("ip_address", ""))
-        
-        if not ok:
-            continue
+    created: list[list[int]] = [[] for _ in events]
+    if not alert_rows:
+        return created
 
-        alert_id = create_alert(
-            client_id=client_id,
-            rule_id=rule["id"],
-            severity=rule["severity"],
-            title=rule["title"],
-            details=event
-        )
+    ids = create_alerts_bulk(alert_rows)
+    for owner, alert_id in zip(owners, ids):
         if alert_id:
-            created.append(alert_id)
-
-        for action in rule.get("actions", []):
-            t = action.get("type")
-            if t == "log":
-                pass
-            elif t == "block_ip":
-                ip = event.get("ip_address")
-                if ip:
-                    block_ip(client_id, ip, f"rule{rule['id']}")
-            elif t == "notify":
-                print(f"[notify] {rule['id']} -> alert {alert_id}")
-                
-    return created
\ No newline at end of file
+            created[owner].append(alert_id)
+    if blocks:
+        block_many(list(blocks.values()))
+    for row, rule_id in notify:
+        print(f"[notify] {rule_id} -> alert {ids[row]}")
+
+    return created
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import os
+import time
+import atexit
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+from models.sketches import load_sketches, merge_sketches
+from services.hll import HyperLogLog, hash64, merge_blobs
+
+SCOPES = ("visitors", "traffic")
+GRANULARITIES = {"minute": 60, "hour": 3600}
+# how long buckets stay in memory after they close (they are persisted by then)
+RETAIN_SECS = {60: 2 * 3600, 3600: 48 * 3600}
+
+Key = Tuple[str, int, int, int]   # (scope, client_id, granularity secs, bucket start epoch)
+
+def _as_epoch(ts) -> float:
+    if ts is None:
+        return time.time()
+    if isinstance(ts, datetime):
+        return (ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)).timestamp()
+    return float(ts)
+
+class DistinctCounters:
+    """
+    HyperLogLog distinct-IP counters per (scope, client, minute/hour bucket).
+
+    add_many() hashes each value once and folds it into the minute and hour
+    sketches under one lock. A background thread merges dirty sketches into
+    Postgres every `flush_secs` (register-wise max, so re-flushing a sketch or
+    flushing the same bucket from several workers never double counts).
+    count() unions persisted and in-memory sketches, so the answer covers
+    every worker that has flushed plus this one's latest updates.
+    """
+
+    def __init__(self, precision: int = 11, flush_secs: float = 30.0):
+        self.precision = precision
+        self.flush_secs = flush_secs
+        self._sketches: Dict[Key, HyperLogLog] = {}
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stats = {"added": 0, "flushes": 0, "flushed_sketches": 0, "flush_errors": 0}
+        atexit.register(self.flush)
+
+    def add_many(self, scope: str, rows: Iterable[Tuple[int | None, str, object]]) -> int:
+        """rows: (client_id, ip, ts) with ts epoch seconds, a datetime or None for now. Returns values counted."""
+        hashed: List[Tuple[int, float, int]] = []
+        for client_id, value, ts in rows:
+            if value:
+                hashed.append((client_id or 0, _as_epoch(ts), hash64(value)))
+        if not hashed:
+            return 0
+        with self._lock:
+            self._ensure_started()
+            for client_id, ts, h in hashed:
+                for gran in GRANULARITIES.values():
+                    key = (scope, client_id, gran, int(ts // gran) * gran)
+                    sketch = self._sketches.get(key)
+                    if sketch is None:
+                        sketch = self._sketches[key] = HyperLogLog(self.precision)
+                    sketch.add_hash(h)
+                    self._dirty.add(key)
+            self._stats["added"] += len(hashed)
+        return len(hashed)
+
+    def flush(self) -> int:
+        """Persist dirty sketches; they stay dirty if the write fails. Returns sketches flushed."""
+        with self._lock:
+            if self._pid not in (None, os.getpid()):
+                return 0
+            dirty, self._dirty = self._dirty, set()
+            rows = [
+                (scope, client_id, gran, datetime.fromtimestamp(start, timezone.utc),
+                 self._sketches[(scope, client_id, gran, start)].to_bytes())
+                for scope, client_id, gran, start in dirty
+            ]
+        if not rows:
+            return 0
+        try:
+            merge_sketches(rows, merge_blobs)
+        except Exception as e:
+            print(f"[distinct] flush of {len(rows)} sketches failed:", e)
+            with self._lock:
+                self._dirty |= dirty
+                self._stats["flush_errors"] += 1
+            return 0
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["flushed_sketches"] += len(rows)
+            self._expire(time.time())
+        return len(rows)
+
+    def count(self, scope: str, client_id: int, granularity: int, start: float, end: float) -> dict:
+        """Distinct values per bucket in [start, end) and over the whole range."""
+        first = int(start // granularity) * granularity
+        persisted = load_sketches(scope, client_id, granularity,
+                                  datetime.fromtimestamp(first, timezone.utc),
+                                  datetime.fromtimestamp(end, timezone.utc))
+        merged: Dict[int, HyperLogLog] = {}
+        for bucket, blob in persisted:
+            try:
+                merged[int(bucket.timestamp())] = HyperLogLog.from_bytes(blob)
+            except Exception:
+                continue
+        with self._lock:
+            local = [(k[3], s.copy()) for k, s in self._sketches.items()
+                     if k[0] == scope and k[1] == client_id and k[2] == granularity and first <= k[3] < end]
+        for bucket, sketch in local:
+            if bucket in merged and merged[bucket].p == sketch.p:
+                merged[bucket].merge(sketch)
+            else:
+                merged[bucket] = sketch
+
+        union = HyperLogLog(self.precision)
+        buckets = []
+        for bucket in sorted(merged):
+            sketch = merged[bucket]
+            buckets.append({"bucket": datetime.fromtimestamp(bucket, timezone.utc).isoformat(),
+                            "count": sketch.count()})
+            if sketch.p == union.p:
+                union.merge(sketch)
+        return {"buckets": buckets, "total": union.count() if buckets else 0}
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["sketches"] = len(self._sketches)
+            out["dirty"] = len(self._dirty)
+            out["precision"] = self.precision
+        return out
+
+    def _expire(self, now: float) -> None:
+        # caller holds self._lock; only clean (already persisted) sketches are dropped
+        for key in [k for k in self._sketches if k not in self._dirty]:
+            gran, start = key[2], key[3]
+            if start + gran + RETAIN_SECS.get(gran, 0) < now:
+                del self._sketches[key]
+
+    def _ensure_started(self) -> None:
+        # caller holds self._lock; each forked worker runs its own flusher
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        if self._pid is not None and self._pid != os.getpid():
+            self._sketches.clear()
+            self._dirty.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="distinct-flush", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_secs)
+            self.flush()
+
+distinct = DistinctCounters(
+    precision=int(os.getenv("DISTINCT_HLL_PRECISION", "11")),
+    flush_secs=float(os.getenv("DISTINCT_FLUSH_SECS", "30")),
+)
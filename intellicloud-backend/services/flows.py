@@ -0,0 +1,153 @@
+from __future__ import annotations
+import collections
+from typing import Dict, List, Tuple
+
+# Fields a flow record carries on top of a packet event's src/dst/sport/dport/proto/ts/dns.
+FLOW_FIELDS = ("flow", "last_ts", "duration", "packets", "bytes", "resp_packets", "resp_bytes",
+               "syn", "synack", "ack", "tcp_state", "end")
+
+FlowKey = Tuple[str, str, int | None, int | None, str]
+
+class _Flow:
+    __slots__ = ("key", "first", "last", "packets", "bytes", "resp_packets", "resp_bytes",
+                 "syn", "synack", "ack", "dns")
+
+    def __init__(self, key: FlowKey, ts: float):
+        self.key = key
+        self.first = ts
+        self.last = ts
+        self.packets = self.bytes = self.resp_packets = self.resp_bytes = 0
+        self.syn = self.synack = self.ack = 0
+        self.dns = None
+
+    def record(self, end: str) -> dict:
+        src, dst, sport, dport, proto = self.key
+        out = {
+            "flow": True,
+            "ts": self.first,
+            "last_ts": self.last,
+            "duration": round(self.last - self.first, 6),
+            "src": src, "dst": dst, "sport": sport, "dport": dport, "proto": proto,
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "resp_packets": self.resp_packets,
+            "resp_bytes": self.resp_bytes,
+            "end": end,
+        }
+        if proto == "tcp":
+            out.update(syn=self.syn, synack=self.synack, ack=self.ack, tcp_state=self._tcp_state())
+        if self.dns:
+            out["dns"] = self.dns
+        return out
+
+    def _tcp_state(self) -> str:
+        if self.syn and not self.synack:
+            return "syn_only"        # no answer: closed/filtered port, the classic scan signature
+        if self.syn and self.synack:
+            return "established"
+        if self.synack:
+            return "synack_only"
+        return "midstream"           # started before capture began
+
+class FlowTable:
+    """
+    Collapses packet events into bidirectional 5-tuple flows.
+
+    The first packet of a (src, dst, sport, dport, proto) tuple makes its src
+    the initiator; packets in the reverse direction count as responses.
+    A flow is emitted when it sees no packet for `idle_timeout` seconds, when
+    it has been open for `active_timeout` seconds (long transfers report
+    periodically and start a new record), or when the table is full and it
+    is the least recently active. Time is packet time, so replaying a capture
+    gives the same flows as watching it live. Flows are kept in LRU order of
+    last packet, so expiry only looks at the oldest entries.
+    """
+
+    def __init__(self, idle_timeout: float = 15.0, active_timeout: float = 60.0, max_flows: int = 100000):
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.max_flows = max_flows
+        self._flows: "collections.OrderedDict[FlowKey, _Flow]" = collections.OrderedDict()
+        self.clock = 0.0
+        self.stats: Dict[str, int] = {"packets": 0, "flows": 0, "idle": 0, "active": 0, "evicted": 0}
+
+    def add(self, pkt: dict) -> List[dict]:
+        """Account one packet event; returns any flow records that completed."""
+        out: List[dict] = []
+        ts = pkt.get("ts")
+        ts = float(ts) if isinstance(ts, (int, float)) else self.clock
+        if ts > self.clock:
+            self.clock = ts
+        self.stats["packets"] += 1
+
+        src, dst = pkt.get("src"), pkt.get("dst")
+        sport, dport, proto = pkt.get("sport"), pkt.get("dport"), (pkt.get("proto") or "ip")
+        key = (src, dst, sport, dport, proto)
+        flow = self._flows.get(key)
+        reply = False
+        if flow is None:
+            flow = self._flows.get((dst, src, dport, sport, proto))
+            reply = flow is not None
+
+        if flow is not None and ts - flow.first >= self.active_timeout:
+            del self._flows[flow.key]
+            out.append(self._emit(flow, "active"))
+            flow, reply = None, False
+        if flow is None:
+            flow = _Flow(key, ts)
+            self._flows[key] = flow
+            if len(self._flows) > self.max_flows:
+                _, oldest = self._flows.popitem(last=False)
+                out.append(self._emit(oldest, "evicted"))
+        else:
+            self._flows.move_to_end(flow.key)
+
+        size = pkt.get("len") or pkt.get("bytes") or 0
+        size = size if isinstance(size, int) else 0
+        if reply:
+            flow.resp_packets += 1
+            flow.resp_bytes += size
+        else:
+            flow.packets += 1
+            flow.bytes += size
+        if ts > flow.last:
+            flow.last = ts
+        syn, ack = pkt.get("syn"), pkt.get("ack")
+        if syn and ack:
+            flow.synack += 1
+        elif syn:
+            flow.syn += 1
+        elif ack:
+            flow.ack += 1
+        if not flow.dns and pkt.get("dns"):
+            flow.dns = pkt["dns"]
+
+        out.extend(self.expire())
+        return out
+
+    def expire(self, now: float | None = None) -> List[dict]:
+        """Emit flows idle for longer than idle_timeout as of `now` (default: latest packet time)."""
+        now = self.clock if now is None else now
+        out = []
+        while self._flows:
+            key, flow = next(iter(self._flows.items()))
+            if now - flow.last < self.idle_timeout:
+                break
+            del self._flows[key]
+            out.append(self._emit(flow, "idle"))
+        return out
+
+    def flush(self) -> List[dict]:
+        """Emit every open flow (end of input)."""
+        out = [self._emit(flow, "flush") for flow in self._flows.values()]
+        self._flows.clear()
+        return out
+
+    def __len__(self) -> int:
+        return len(self._flows)
+
+    def _emit(self, flow: _Flow, end: str) -> dict:
+        self.stats["flows"] += 1
+        if end in ("idle", "active", "evicted"):
+            self.stats[end] += 1
+        return flow.record(end)
@@ -1,10 +1,50 @@
 from __future__ import annotations
 import os
-from typing import Dict, Any, Tuple
+import threading
+from typing import Dict, Any, Iterable, Tuple
 import maxminddb
+from cachetools import LRUCache
 
 CITY_DB = os.getenv("GEOIP_CITY_DB", "/data/GeoLite2-City.mmdb")
 ASN_DB  = os.getenv("GEOIP_ASN_DB",  "/data/GeoLite2-ASN.mmdb")
+GEO_CACHE_SIZE = int(os.getenv("GEO_CACHE_SIZE", "65536"))
+
+class GeoCache:
+    """
+    Bounded per-IP cache of enrichment results. One lives in each readers
+    dict, so swapping readers (/ops/reload-geo) swaps the cache with them.
+    Cached dicts are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, maxsize: int = GEO_CACHE_SIZE):
+        self._lru = LRUCache(maxsize=max(1, maxsize))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ip: str, load) -> dict:
+        with self._lock:
+            out = self._lru.get(ip)
+            if out is not None:
+                self.hits += 1
+                return out
+            self.misses += 1
+        out = load(ip)
+        with self._lock:
+            self._lru[ip] = out
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses, size = self.hits, self.misses, len(self._lru)
+        total = hits + misses
+        return {
+            "size": size,
+            "maxsize": self._lru.maxsize,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
 
 def load_readers(city_path: str | None = None, asn_path: str | None = None) -> Dict[str, Any]:
     city_path = city_path or CITY_DB
@@ -14,6 +54,7 @@ def load_readers(city_path: str | None = None, asn_path: str | None = None) -> D
         "asn":  None,
         "city_path": city_path,
         "asn_path":  asn_path,
+        "cache": GeoCache(),
     }
     if os.path.exists(city_path):
         try:
@@ -27,31 +68,46 @@ def load_readers(city_path: str | None = None, asn_path: str | None = None) -> D
             readers["asn"] = None
     return readers
 
+def _lookup(ip: str, readers: Dict[str, Any]) -> dict:
+    out: dict = {}
+    try:
+        r = readers.get("city")
+        if r:
+            rec = r.get(ip) or {}
+            city = (rec.get("city") or {}).get("names", {}).get("en")
+            cc   = (rec.get("country") or {}).get("iso_code")
+            if city: out["city"] = city
+            if cc:   out["country"] = cc
+    except Exception:
+        pass
+    try:
+        r = readers.get("asn")
+        if r:
+            rec = r.get(ip) or {}
+            asn = rec.get("autonomous_system_number")
+            org = rec.get("autonomous_system_organization")
+            if asn: out["asn"] = asn
+            if org: out["asn_org"] = org
+    except Exception:
+        pass
+    return out
+
+def enrich(ip: str, readers: Dict[str, Any]) -> dict:
+    """City/country/ASN for one IP, served from the readers' GeoCache when present."""
+    ip = ip or ""
+    if not ip or not (readers.get("city") or readers.get("asn")):
+        return {}
+    cache = readers.get("cache")
+    if cache is None:
+        return _lookup(ip, readers)
+    return cache.get(ip, lambda key: _lookup(key, readers))
+
 def enrich_pair(src_ip: str, dst_ip: str, readers: Dict[str, Any]) -> Tuple[dict, dict]:
-    def _enrich(ip: str) -> dict:
-        out: dict = {}
-        try:
-            r = readers.get("city")
-            if r:
-                rec = r.get(ip) or {}
-                city = (rec.get("city") or {}).get("names", {}).get("en")
-                cc   = (rec.get("country") or {}).get("iso_code")
-                if city: out["city"] = city
-                if cc:   out["country"] = cc
-        except Exception:
-            pass
-        try:
-            r = readers.get("asn")
-            if r:
-                rec = r.get(ip) or {}
-                asn = rec.get("autonomous_system_number")
-                org = rec.get("autonomous_system_organization")
-                if asn: out["asn"] = asn
-                if org: out["asn_org"] = org
-        except Exception:
-            pass
-        return out
-    return _enrich(src_ip or ""), _enrich(dst_ip or "")
+    return enrich(src_ip, readers), enrich(dst_ip, readers)
+
+def enrich_many(ips: Iterable[str], readers: Dict[str, Any]) -> Dict[str, dict]:
+    """Enrich a batch: each distinct IP is looked up once. Returns {ip: geo}."""
+    return {ip: enrich(ip, readers) for ip in {ip for ip in ips if ip and isinstance(ip, str)}}
 
 def geo_status(readers: Dict[str, Any]) -> Dict[str, Any]:
     city_path = readers.get("city_path", CITY_DB)
@@ -63,4 +119,5 @@ def geo_status(readers: Dict[str, Any]) -> Dict[str, Any]:
         "asn_db":      asn_path,
         "asn_exists":  os.path.exists(asn_path),
         "asn_loaded":  readers.get("asn") is not None,
+        "cache":       cache.stats() if (cache := readers.get("cache")) else None,
     }
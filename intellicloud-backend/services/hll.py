@@ -0,0 +1,87 @@
+from __future__ import annotations
+import math
+import zlib
+import hashlib
+from typing import Iterable
+
+_INV_POW2 = [2.0 ** -r for r in range(65)]
+
+def hash64(value) -> int:
+    """Stable 64-bit hash (the same in every worker and across restarts, unlike hash())."""
+    data = value if isinstance(value, bytes) else str(value).encode("utf-8", "surrogatepass")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+class HyperLogLog:
+    """
+    HyperLogLog cardinality sketch with 2**p one-byte registers
+    (p=11: 2 KiB, ~2.3% standard error). Sketches of the same precision
+    merge by register-wise max, so per-worker or per-minute sketches can be
+    combined losslessly into larger ones.
+    """
+    __slots__ = ("p", "m", "registers")
+
+    def __init__(self, p: int = 11, registers: bytes | bytearray | None = None):
+        if not 4 <= p <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError("register array does not match precision")
+
+    def add_hash(self, h: int) -> None:
+        idx = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def add(self, value) -> None:
+        self.add_hash(hash64(value))
+
+    def update(self, values: Iterable) -> None:
+        for v in values:
+            self.add_hash(hash64(v))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError("cannot merge sketches of different precision")
+        regs = self.registers
+        for i, r in enumerate(other.registers):
+            if r > regs[i]:
+                regs[i] = r
+        return self
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        total = 0.0
+        zeros = 0
+        for r in self.registers:
+            total += _INV_POW2[r]
+            if not r:
+                zeros += 1
+        est = alpha * m * m / total
+        if est <= 2.5 * m and zeros:
+            est = m * math.log(m / zeros)   # linear counting for small cardinalities
+        return int(round(est))
+
+    def copy(self) -> "HyperLogLog":
+        return HyperLogLog(self.p, self.registers)
+
+    def to_bytes(self) -> bytes:
+        """Precision byte + zlib-compressed registers; sparse sketches shrink to a few bytes."""
+        return bytes([self.p]) + zlib.compress(bytes(self.registers), 6)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "HyperLogLog":
+        blob = bytes(blob)
+        return cls(blob[0], zlib.decompress(blob[1:]))
+
+def merge_blobs(a: bytes, b: bytes) -> bytes:
+    """Merge two serialized sketches (either may be empty)."""
+    if not a:
+        return bytes(b)
+    if not b:
+        return bytes(a)
+    return HyperLogLog.from_bytes(a).merge(HyperLogLog.from_bytes(b)).to_bytes()
@@ -0,0 +1,150 @@
+from __future__ import annotations
+import gzip
+import json
+import zlib
+from itertools import islice
+from typing import IO, Any, Iterable, Iterator, List
+import msgpack
+
+try:
+    import zstandard
+except ImportError:  # zstd bodies are refused with 415 until it's installed
+    zstandard = None
+
+READ_SIZE = 1 << 16
+
+NDJSON_TYPES = frozenset({"application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines"})
+MSGPACK_TYPES = frozenset({"application/msgpack", "application/x-msgpack", "application/vnd.msgpack"})
+ENCODINGS = ("identity", "gzip", "zstd")
+
+_CORRUPT = (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+class IngestDecodeError(ValueError):
+    """Body can't be decoded; `code` and `status` go straight into the HTTP response."""
+
+    def __init__(self, detail: str, code: str = "bad_body", status: int = 400):
+        super().__init__(detail)
+        self.code = code
+        self.status = status
+
+class _Body:
+    """read() over the decompressed request body; refuses to produce more than `limit` bytes."""
+
+    def __init__(self, raw: IO[bytes], encoding: str, limit: int):
+        self.raw = raw
+        self.encoding = encoding
+        self.limit = limit
+        self.total = 0
+
+    def read(self, n: int = READ_SIZE) -> bytes:
+        try:
+            data = self.raw.read(n)
+        except _CORRUPT as e:
+            raise IngestDecodeError(f"corrupt {self.encoding} body: {e}") from None
+        self.total += len(data)
+        if self.total > self.limit:
+            raise IngestDecodeError(f"body is larger than {self.limit} bytes decoded", "too_large", 413)
+        return data
+
+def open_body(stream: IO[bytes], encoding: str | None, limit: int) -> _Body:
+    """Wrap the raw request stream according to Content-Encoding."""
+    enc = (encoding or "identity").strip().lower() or "identity"
+    if enc == "identity":
+        raw = stream
+    elif enc in ("gzip", "x-gzip"):
+        raw = gzip.GzipFile(fileobj=stream, mode="rb")
+    elif enc == "zstd":
+        if zstandard is None:
+            raise IngestDecodeError("zstd bodies need the zstandard package", "unsupported_encoding", 415)
+        raw = zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+    else:
+        raise IngestDecodeError(f"Content-Encoding must be one of {list(ENCODINGS)}", "unsupported_encoding", 415)
+    return _Body(raw, enc, limit)
+
+def _expand(obj: Any) -> Iterator[Any]:
+    # a record may also be a whole batch: [ev, ...] or {"items": [...]}
+    if isinstance(obj, list):
+        yield from obj
+    elif isinstance(obj, dict) and isinstance(obj.get("items"), list):
+        yield from obj["items"]
+    else:
+        yield obj
+
+def iter_json(body: _Body) -> Iterator[Any]:
+    """A single JSON document: [ev, ...] or {"items": [...]}. Parsed whole."""
+    raw = b"".join(iter(lambda: body.read(), b""))
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        raise IngestDecodeError("body is not valid JSON", "bad_json") from None
+    items = data if isinstance(data, list) else data.get("items", []) if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        raise IngestDecodeError("items must be a list", "items_must_be_list")
+    return iter(items)
+
+def iter_ndjson(body: _Body) -> Iterator[Any]:
+    """One JSON event per line, decoded as the body arrives."""
+    buf = bytearray()
+    scan = 0      # bytes of buf already searched for a newline
+    lineno = 0
+    while True:
+        chunk = body.read()
+        buf += chunk
+        start = 0
+        while True:
+            nl = buf.find(b"\n", scan)
+            if nl < 0:
+                if chunk:
+                    break
+                nl = len(buf)   # last line without a trailing newline
+            line = bytes(buf[start:nl])
+            start = scan = nl + 1
+            lineno += 1
+            if line.strip():
+                try:
+                    obj = json.loads(line)
+                except ValueError:
+                    raise IngestDecodeError(f"line {lineno} is not valid JSON", "bad_json") from None
+                yield from _expand(obj)
+            if start >= len(buf):
+                break
+        if not chunk:
+            return
+        del buf[:start]
+        scan = len(buf)
+
+def iter_msgpack(body: _Body) -> Iterator[Any]:
+    """A stream of msgpack maps (one per event), decoded as the body arrives."""
+    unpacker = msgpack.Unpacker(raw=False, max_buffer_size=body.limit)
+    fed = used = 0
+    while True:
+        chunk = body.read()
+        if not chunk:
+            break
+        unpacker.feed(chunk)
+        fed += len(chunk)
+        try:
+            for obj in unpacker:
+                used = unpacker.tell()   # only accurate right after a complete object
+                yield from _expand(obj)
+        except (ValueError, msgpack.UnpackException) as e:
+            raise IngestDecodeError(f"bad msgpack: {e}", "bad_msgpack") from None
+    if used != fed:
+        raise IngestDecodeError("msgpack body ends mid-object", "bad_msgpack")
+
+def iter_items(stream: IO[bytes], mimetype: str, encoding: str | None, limit: int) -> Iterator[Any]:
+    """Raw ingest items from a request body, picked by Content-Type and Content-Encoding."""
+    body = open_body(stream, encoding, limit)
+    if mimetype in NDJSON_TYPES:
+        return iter_ndjson(body)
+    if mimetype in MSGPACK_TYPES:
+        return iter_msgpack(body)
+    return iter_json(body)   # anything else is JSON, as before
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import os
+from functools import lru_cache
+from typing import Dict, Iterable, List
+from services.cidr import CidrSet, ip_to_int
+
+# Checked in this order; the first class containing an address wins, so
+# operator ranges ("vpc") can carve out pieces of the broader defaults.
+DEFAULT_CLASSES: Dict[str, List[str]] = {
+    "loopback":   ["127.0.0.0/8", "::1/128"],
+    "link_local": ["169.254.0.0/16", "fe80::/10"],
+    "private":    ["10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16"],
+    "cgnat":      ["100.64.0.0/10"],
+    "ula":        ["fc00::/7"],
+}
+PUBLIC = "public"
+INVALID = "invalid"
+
+class NetworkClassifier:
+    """
+    Maps an address to a named class ("vpc", "private", "cgnat", "ula", ...,
+    "public", or "invalid") with integer range checks over CidrSets.
+    Results are memoized per address string in an LRU.
+    """
+
+    def __init__(self, classes: Dict[str, Iterable[str]], internal: Iterable[str] | None = None,
+                 memo_size: int = 65536):
+        self._classes = [(name, CidrSet(cidrs)) for name, cidrs in classes.items()]
+        names = [name for name, _ in self._classes]
+        self.internal_classes = frozenset(names if internal is None else internal)
+        # union of every internal class, for callers doing their own (e.g. vectorized) range checks
+        self.internal = CidrSet(
+            c for name, cidrs in classes.items() if name in self.internal_classes for c in cidrs
+        )
+        self._memo = lru_cache(maxsize=memo_size)(self._classify)
+
+    @classmethod
+    def from_env(cls) -> "NetworkClassifier":
+        """Defaults plus INTERNAL_CIDRS (comma-separated operator/VPC ranges, classed as "vpc")."""
+        extra = [c.strip() for c in os.getenv("INTERNAL_CIDRS", "").split(",") if c.strip()]
+        classes: Dict[str, List[str]] = {"vpc": extra} if extra else {}
+        classes.update(DEFAULT_CLASSES)
+        return cls(classes, memo_size=int(os.getenv("NETCLASS_MEMO_SIZE", "65536")))
+
+    def _classify(self, ip: str) -> str:
+        parsed = ip_to_int(ip)
+        if parsed is None:
+            return INVALID
+        for name, nets in self._classes:
+            if nets.contains_int(*parsed):
+                return name
+        return PUBLIC
+
+    def classify(self, ip) -> str:
+        if not isinstance(ip, str):
+            return INVALID
+        return self._memo(ip)
+
+    def is_internal(self, ip) -> bool:
+        return self.classify(ip) in self.internal_classes
+
+    def is_public(self, ip) -> bool:
+        return self.classify(ip) == PUBLIC
+
+    def stats(self) -> dict:
+        info = self._memo.cache_info()
+        total = info.hits + info.misses
+        return {
+            "classes": {name: nets.stats()["entries"] for name, nets in self._classes},
+            "memo_size": info.currsize,
+            "memo_hits": info.hits,
+            "memo_misses": info.misses,
+            "memo_hit_rate": round(info.hits / total, 4) if total else 0.0,
+        }
+
+classifier = NetworkClassifier.from_env()
@@ -0,0 +1,142 @@
+from __future__ import annotations
+import os
+import time
+import threading
+import collections
+from typing import List
+
+class _Distinct:
+    """
+    Distinct values over a sliding window made of two half-window epochs.
+    |prev ∪ cur| is kept as len(prev) + fresh (values in cur but not prev),
+    so each add is O(1). Each epoch stops growing at `cap` values; past the
+    threshold the exact count no longer matters.
+    """
+    __slots__ = ("prev", "cur", "fresh")
+
+    def __init__(self):
+        self.prev: set = set()
+        self.cur: set = set()
+        self.fresh = 0
+
+    def rotate(self, steps: int) -> None:
+        self.prev = self.cur if steps == 1 else set()
+        self.cur = set()
+        self.fresh = 0
+
+    def add(self, value, cap: int) -> None:
+        if value in self.cur or len(self.cur) >= cap:
+            return
+        self.cur.add(value)
+        if value not in self.prev:
+            self.fresh += 1
+
+    def __len__(self) -> int:
+        return len(self.prev) + self.fresh
+
+class _Source:
+    __slots__ = ("epoch", "ports", "hosts", "alerted")
+
+    def __init__(self, epoch: int):
+        self.epoch = epoch
+        self.ports = _Distinct()
+        self.hosts = _Distinct()
+        self.alerted = {}   # kind -> epoch of the last finding
+
+class ScanDetector:
+    """
+    Flags sources that touch many distinct destination ports (port scan) or
+    hosts (sweep) within `window_secs`.
+
+    State is one small record per source in an LRU capped at `max_sources`
+    (idle sources fall off the end); each record holds at most `threshold`
+    values per half-window, so memory is bounded and every event is O(1).
+    A source is reported at most once per kind per window.
+    """
+
+    def __init__(self, port_threshold: int = 100, host_threshold: int = 50,
+                 window_secs: float = 60.0, max_sources: int = 50000):
+        self.port_threshold = port_threshold
+        self.host_threshold = host_threshold
+        self.half = window_secs / 2.0
+        self.max_sources = max_sources
+        self._sources: "collections.OrderedDict[str, _Source]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"events": 0, "port_scans": 0, "sweeps": 0, "evicted": 0}
+
+    def _epoch(self, ev: dict, now: float) -> int:
+        ts = ev.get("ts")
+        if not isinstance(ts, (int, float)) or ts != ts:
+            ts = now
+        return int(ts // self.half)
+
+    def observe(self, events: List[dict], now: float | None = None) -> List[dict]:
+        """Feed a batch of normalized events; returns one finding per tripped (source, kind)."""
+        now = time.time() if now is None else now
+        findings = []
+        with self._lock:
+            sources = self._sources
+            for ev in events:
+                src, dst, dport = ev.get("src"), ev.get("dst"), ev.get("dport")
+                if not isinstance(src, str) or not isinstance(dst, str) or not src or not dst:
+                    continue
+                epoch = self._epoch(ev, now)
+                st = sources.get(src)
+                if st is None:
+                    st = sources[src] = _Source(epoch)
+                    if len(sources) > self.max_sources:
+                        sources.popitem(last=False)
+                        self._stats["evicted"] += 1
+                else:
+                    sources.move_to_end(src)
+                    if epoch > st.epoch:
+                        steps = epoch - st.epoch
+                        st.ports.rotate(steps)
+                        st.hosts.rotate(steps)
+                        st.epoch = epoch
+
+                if dport is not None:
+                    st.ports.add(dport, self.port_threshold)
+                st.hosts.add(dst, self.host_threshold)
+
+                if len(st.ports) >= self.port_threshold and self._due(st, "port_scan"):
+                    findings.append(self._finding("port_scan", src, ev, st))
+                    self._stats["port_scans"] += 1
+                if len(st.hosts) >= self.host_threshold and self._due(st, "sweep"):
+                    findings.append(self._finding("sweep", src, ev, st))
+                    self._stats["sweeps"] += 1
+            self._stats["events"] += len(events)
+        return findings
+
+    def _due(self, st: _Source, kind: str) -> bool:
+        last = st.alerted.get(kind)
+        if last is not None and st.epoch - last < 2:   # already reported within this window
+            return False
+        st.alerted[kind] = st.epoch
+        return True
+
+    def _finding(self, kind: str, src: str, ev: dict, st: _Source) -> dict:
+        return {
+            "kind": kind,
+            "src": src,
+            "ports": len(st.ports),
+            "hosts": len(st.hosts),
+            "window_secs": self.half * 2,
+            "dir": ev.get("dir"),
+            "client_id": ev.get("client_id"),
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["sources"] = len(self._sources)
+        out.update(port_threshold=self.port_threshold, host_threshold=self.host_threshold,
+                   window_secs=self.half * 2, max_sources=self.max_sources)
+        return out
+
+scan_detector = ScanDetector(
+    port_threshold=int(os.getenv("SCAN_PORT_THRESHOLD", "100")),
+    host_threshold=int(os.getenv("SCAN_HOST_THRESHOLD", "50")),
+    window_secs=float(os.getenv("SCAN_WINDOW_SECS", "60")),
+    max_sources=int(os.getenv("SCAN_MAX_SOURCES", "50000")),
+)
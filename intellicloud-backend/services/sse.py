@@ -0,0 +1,253 @@
+from __future__ import annotations
+import json
+import time
+import os
+import itertools
+import threading
+from typing import Callable, Dict, Iterator, List, Tuple
+
+HEARTBEAT_SECS = 3.0
+SSE_HEADERS = {"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
+
+# What happens to a subscriber that falls more than max_lag frames behind:
+#   drop-oldest  skip ahead silently
+#   coalesce     skip ahead and send one `event: missed` frame with the count
+#   disconnect   end the stream; EventSource reconnects and gets the replay
+SLOW_POLICIES = ("drop-oldest", "coalesce", "disconnect")
+SLOW_POLICY = os.getenv("SSE_SLOW_POLICY", "coalesce")
+if SLOW_POLICY not in SLOW_POLICIES:
+    SLOW_POLICY = "coalesce"
+
+Match = Callable[[dict], bool]   # per-subscriber event predicate, see services.stream_filter
+
+class SlowConsumer(Exception):
+    """Raised by FrameRing.pull() for a lagging subscriber under the disconnect policy."""
+
+class Subscriber:
+    """One open stream: its cursor into the ring plus lag/drop counters for /ops/streams."""
+    __slots__ = ("id", "peer", "policy", "max_lag", "filtered", "cursor", "since",
+                 "sent", "dropped", "overruns", "peak_lag")
+    _ids = itertools.count(1)
+
+    def __init__(self, cursor: int, policy: str, max_lag: int, peer: str = "", filtered: bool = False):
+        self.id = next(self._ids)
+        self.peer = peer
+        self.policy = policy
+        self.max_lag = max_lag
+        self.filtered = filtered
+        self.cursor = cursor
+        self.since = time.time()
+        self.sent = 0        # frames written
+        self.dropped = 0     # frames skipped because the subscriber lagged
+        self.overruns = 0    # how many times it lagged past max_lag
+        self.peak_lag = 0    # largest backlog seen at a read
+
+    def stats(self, head: int) -> dict:
+        return {
+            "id": self.id,
+            "peer": self.peer,
+            "policy": self.policy,
+            "filtered": self.filtered,
+            "connected_secs": round(time.time() - self.since, 1),
+            "lag": max(head - self.cursor, 0),
+            "peak_lag": self.peak_lag,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "overruns": self.overruns,
+        }
+
+class FrameRing:
+    """
+    Fixed-size, append-only ring of pre-encoded SSE `data:` frames.
+
+    publish() serializes an event once and wakes every reader with a single
+    notify_all(); each subscriber only keeps an integer cursor (the last
+    sequence number it sent), so fan-out costs one json.dumps and one lock
+    acquisition per event no matter how many dashboards are connected.
+    A subscriber that falls more than `max_lag` frames behind (at most
+    `capacity`) is handled by its slow-consumer policy, so a stalled tab can
+    never hold more than the ring itself.
+
+    Each slot also keeps the event dict the frame was built from, so filtered
+    subscribers can test fields without re-parsing. Frames published already
+    encoded (e.g. from the Redis backplane) are decoded at most once, on the
+    first filtered read.
+    """
+
+    def __init__(self, capacity: int = 1024, policy: str | None = None, max_lag: int | None = None):
+        self.capacity = capacity
+        self.policy = policy or SLOW_POLICY
+        self.max_lag = min(max_lag or int(os.getenv("SSE_MAX_LAG", "0")) or capacity, capacity)
+        self._subs: Dict[int, Subscriber] = {}
+        self.dropped = 0
+        self.disconnects = 0
+        self._frames: List[str | None] = [None] * capacity
+        self._events: List[dict | None] = [None] * capacity
+        self._seq = 0                     # sequence number of the newest frame; 0 = empty
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def encode(ev: dict) -> str:
+        return f"data: {json.dumps(ev)}\n\n"
+
+    def publish(self, ev: dict) -> int:
+        return self.publish_frame(self.encode(ev), ev)
+
+    def publish_frame(self, frame: str, ev: dict | None = None) -> int:
+        with self._cond:
+            self._seq += 1
+            self._frames[self._seq % self.capacity] = frame
+            self._events[self._seq % self.capacity] = ev
+            self._cond.notify_all()
+            return self._seq
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def wait(self, cursor: int, timeout: float) -> int:
+        """Block until the ring moves past `cursor` (or `timeout`); returns the newest seq."""
+        with self._cond:
+            if self._seq == cursor:
+                self._cond.wait(timeout)
+            return self._seq
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    def subscribe(self, replay: int = 0, match: Match | None = None, peer: str = "",
+                  policy: str | None = None) -> Tuple[Subscriber, List[str]]:
+        """Register a subscriber; returns it with the replay frames to send first."""
+        frames, cursor = self.tail(replay, match)
+        sub = Subscriber(cursor, policy or self.policy, self.max_lag, peer=peer, filtered=match is not None)
+        with self._cond:
+            self._subs[sub.id] = sub
+        return sub, frames
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._cond:
+            self._subs.pop(sub.id, None)
+
+    @staticmethod
+    def missed_frame(n: int) -> str:
+        return f'event: missed\ndata: {{"missed": {n}}}\n\n'
+
+    def pull(self, sub: Subscriber, timeout: float, match: Match | None = None) -> List[str]:
+        """
+        Next frames for `sub` (waiting up to `timeout`), with its slow-consumer
+        policy applied. Raises SlowConsumer when it should be disconnected.
+        """
+        frames, head, missed = self.read(sub.cursor, timeout, match, max_lag=sub.max_lag)
+        lag = head - sub.cursor
+        if lag > sub.peak_lag:
+            sub.peak_lag = lag
+        sub.cursor = head
+        if missed:
+            sub.dropped += missed
+            sub.overruns += 1
+            with self._cond:
+                self.dropped += missed
+                if sub.policy == "disconnect":
+                    self.disconnects += 1
+            if sub.policy == "disconnect":
+                raise SlowConsumer(f"subscriber {sub.id} lagged {lag} frames")
+        sub.sent += len(frames)
+        if missed and sub.policy == "coalesce":
+            frames = [self.missed_frame(missed)] + frames
+        return frames
+
+    def _matching(self, slots: List[Tuple[int, str, dict | None]], match: Match) -> List[str]:
+        """Frames from (slot, frame, event) triples whose event passes `match`; decodes missing events once."""
+        out = []
+        for slot, frame, ev in slots:
+            if ev is None:
+                try:
+                    ev = json.loads(frame[len("data: "):])
+                except ValueError:
+                    continue
+                with self._cond:
+                    if self._frames[slot] is frame:
+                        self._events[slot] = ev
+            if match(ev):
+                out.append(frame)
+        return out
+
+    def tail(self, n: int, match: Match | None = None) -> Tuple[List[str], int]:
+        """
+        The newest `n` frames (oldest first) and the cursor to continue from.
+        With `match`, the newest `n` matching frames still held in the ring.
+        """
+        with self._cond:
+            head = self._seq
+            if match is None:
+                start = max(head - min(n, self.capacity), 0)
+                return [self._frames[s % self.capacity] for s in range(start + 1, head + 1)], head
+            start = max(head - self.capacity, 0)
+            slots = [(s % self.capacity, self._frames[s % self.capacity], self._events[s % self.capacity])
+                     for s in range(start + 1, head + 1)]
+        frames = self._matching(slots, match)
+        return (frames[-n:] if n > 0 else []), head
+
+    def read(self, cursor: int, timeout: float, match: Match | None = None,
+             max_lag: int | None = None) -> Tuple[List[str], int, int]:
+        """
+        Frames after `cursor`, waiting up to `timeout` seconds if there are none.
+        Returns (frames, new_cursor, missed); frames more than `max_lag` (default
+        capacity) behind the head are skipped and counted in `missed`. With
+        `match`, only frames whose event passes it are returned; the cursor
+        still advances past the rest.
+        """
+        with self._cond:
+            if self._seq == cursor and timeout > 0:
+                self._cond.wait(timeout)
+            head = self._seq
+            missed = 0
+            oldest = head - min(max_lag or self.capacity, self.capacity)
+            if cursor < oldest:
+                missed = oldest - cursor
+                cursor = oldest
+            if match is None:
+                return [self._frames[s % self.capacity] for s in range(cursor + 1, head + 1)], head, missed
+            slots = [(s % self.capacity, self._frames[s % self.capacity], self._events[s % self.capacity])
+                     for s in range(cursor + 1, head + 1)]
+        return self._matching(slots, match), head, missed
+
+    def stream(self, replay: int = 0, heartbeat: float = HEARTBEAT_SECS,
+               match: Match | None = None, peer: str = "") -> Iterator[str]:
+        """SSE body generator: replay the last `replay` frames, then follow the ring."""
+        sub, frames = self.subscribe(replay, match, peer=peer)
+        try:
+            for frame in frames:
+                yield frame
+            yield ": keep-alive\n\n"
+            last_write = time.monotonic()
+            while True:
+                remaining = max(0.0, heartbeat - (time.monotonic() - last_write))
+                frames = self.pull(sub, remaining, match)
+                for frame in frames:
+                    yield frame
+                if frames:
+                    last_write = time.monotonic()
+                elif time.monotonic() - last_write >= heartbeat:
+                    yield ": keep-alive\n\n"
+                    last_write = time.monotonic()
+        except SlowConsumer:
+            yield ": slow consumer, closing\n\n"
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self, detail: bool = False) -> dict:
+        with self._cond:
+            out = {
+                "seq": self._seq,
+                "capacity": self.capacity,
+                "policy": self.policy,
+                "max_lag": self.max_lag,
+                "subscribers": len(self._subs),
+                "dropped": self.dropped,
+                "slow_disconnects": self.disconnects,
+            }
+            if detail:
+                out["clients"] = [sub.stats(self._seq) for sub in self._subs.values()]
+            return out
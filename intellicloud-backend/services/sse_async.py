@@ -0,0 +1,87 @@
+from __future__ import annotations
+import time
+import asyncio
+import threading
+from typing import AsyncIterator, Dict, Tuple
+from services.sse import FrameRing, HEARTBEAT_SECS, Match, SlowConsumer
+
+class RingWaker:
+    """
+    Bridges a FrameRing to one asyncio loop. A single thread blocks on the
+    ring and, when it advances, wakes every coroutine waiting on this waker
+    with one call_soon_threadsafe (wake-ups are coalesced while one is still
+    pending), so idle SSE connections cost a coroutine, not a thread.
+    """
+
+    def __init__(self, ring: FrameRing, loop: asyncio.AbstractEventLoop):
+        self.ring = ring
+        self.loop = loop
+        self._changed = asyncio.Event()
+        self._scheduled = False
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="sse-waker", daemon=True).start()
+
+    def _run(self) -> None:
+        seq = self.ring.seq
+        while not self.loop.is_closed():
+            new = self.ring.wait(seq, 1.0)
+            if new == seq:
+                continue
+            seq = new
+            with self._lock:
+                if self._scheduled:
+                    continue
+                self._scheduled = True
+            try:
+                self.loop.call_soon_threadsafe(self._fire)
+            except RuntimeError:   # loop closed
+                return
+
+    def _fire(self) -> None:
+        with self._lock:
+            self._scheduled = False
+        event, self._changed = self._changed, asyncio.Event()
+        event.set()
+
+    async def wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+_wakers: Dict[Tuple[int, int], RingWaker] = {}
+
+def waker_for(ring: FrameRing) -> RingWaker:
+    loop = asyncio.get_running_loop()
+    key = (id(ring), id(loop))
+    waker = _wakers.get(key)
+    if waker is None:
+        waker = _wakers[key] = RingWaker(ring, loop)
+    return waker
+
+async def stream(ring: FrameRing, replay: int = 0, heartbeat: float = HEARTBEAT_SECS,
+                 match: Match | None = None, peer: str = "") -> AsyncIterator[str]:
+    """Async counterpart of FrameRing.stream(); frames that arrive together are yielded as one chunk."""
+    waker = waker_for(ring)
+    sub, frames = ring.subscribe(replay, match, peer=peer)
+    try:
+        yield "".join(frames) + ": keep-alive\n\n"
+        last_write = time.monotonic()
+        while True:
+            try:
+                frames = ring.pull(sub, 0, match)
+            except SlowConsumer:
+                yield ": slow consumer, closing\n\n"
+                return
+            if frames:
+                yield "".join(frames)
+                last_write = time.monotonic()
+                continue
+            remaining = heartbeat - (time.monotonic() - last_write)
+            if remaining <= 0:
+                yield ": keep-alive\n\n"
+                last_write = time.monotonic()
+            else:
+                await waker.wait(remaining)
+    finally:
+        ring.unsubscribe(sub)
@@ -0,0 +1,110 @@
+from __future__ import annotations
+from typing import Callable, List, Mapping
+from services.cidr import CidrSet, cidr_interval
+from services.traffic_pipeline import DIRS, LEVELS
+
+# Query parameters understood by /stream/traffic. Each takes a comma-separated
+# list and may be repeated; values within one parameter are OR-ed, parameters
+# are AND-ed. country/asn match when either endpoint does.
+FILTER_PARAMS = ("dir", "level", "proto", "dport", "src", "dst", "country", "asn", "client")
+
+class FilterError(ValueError):
+    """A stream filter parameter could not be parsed."""
+
+def _values(args: Mapping[str, List[str]], key: str) -> List[str]:
+    raw = args.get(key) or []
+    if isinstance(raw, str):
+        raw = [raw]
+    return [v.strip() for item in raw for v in str(item).split(",") if v.strip()]
+
+def _ints(key: str, values: List[str]) -> List[int]:
+    try:
+        return [int(v) for v in values]
+    except ValueError:
+        raise FilterError(f"{key} must be integers")
+
+def _ports(values: List[str]):
+    """'22,80,8000-8100' -> (set of single ports, list of (lo, hi) ranges)."""
+    singles, ranges = set(), []
+    for v in values:
+        lo, sep, hi = v.partition("-")
+        try:
+            if sep:
+                ranges.append((int(lo), int(hi)))
+            else:
+                singles.add(int(v))
+        except ValueError:
+            raise FilterError(f"bad dport {v!r}")
+    return frozenset(singles), tuple(ranges)
+
+def _cidrs(key: str, values: List[str]) -> CidrSet:
+    for v in values:
+        try:
+            cidr_interval(v)
+        except ValueError:
+            raise FilterError(f"bad {key} network {v!r}")
+    return CidrSet(values)
+
+def _geo_field(ev: dict, field: str):
+    return ((ev.get("src_geo") or {}).get(field), (ev.get("dst_geo") or {}).get(field))
+
+def compile_filter(args: Mapping[str, List[str]]) -> Callable[[dict], bool] | None:
+    """
+    Build one predicate from stream query parameters (a {name: [values]}
+    mapping, e.g. request.args.to_dict(flat=False) or parse_qs()).
+    Returns None when no filter parameter is present so unfiltered
+    subscribers keep the fast path. Raises FilterError on bad input.
+    Checks run cheapest first and stop at the first miss.
+    """
+    checks: List[Callable[[dict], bool]] = []
+
+    if dirs := _values(args, "dir"):
+        bad = [d for d in dirs if d not in DIRS]
+        if bad:
+            raise FilterError(f"dir must be one of {', '.join(DIRS)}")
+        want = frozenset(dirs)
+        checks.append(lambda ev: ev.get("dir") in want)
+
+    if levels := _values(args, "level"):
+        by_lower = {lv.lower(): lv for lv in LEVELS}
+        if any(lv.lower() not in by_lower for lv in levels):
+            raise FilterError(f"level must be one of {', '.join(LEVELS)}")
+        want_levels = frozenset(by_lower[lv.lower()] for lv in levels)
+        checks.append(lambda ev: ev.get("level") in want_levels)
+
+    if protos := _values(args, "proto"):
+        want_protos = frozenset(p.lower() for p in protos)
+        checks.append(lambda ev: str(ev.get("proto") or "").lower() in want_protos)
+
+    if ports := _values(args, "dport"):
+        singles, ranges = _ports(ports)
+        checks.append(lambda ev: (d := ev.get("dport")) is not None
+                      and (d in singles or any(lo <= d <= hi for lo, hi in ranges)))
+
+    if clients := _values(args, "client"):
+        want_clients = frozenset(_ints("client", clients))
+        checks.append(lambda ev: ev.get("client_id") in want_clients)
+
+    if countries := _values(args, "country"):
+        want_cc = frozenset(c.upper() for c in countries)
+        checks.append(lambda ev: any(c in want_cc for c in _geo_field(ev, "country")))
+
+    if asns := _values(args, "asn"):
+        want_asn = frozenset(_ints("asn", [a.upper().removeprefix("AS") for a in asns]))
+        checks.append(lambda ev: any(a in want_asn for a in _geo_field(ev, "asn")))
+
+    for key in ("src", "dst"):
+        if nets := _values(args, key):
+            cs = _cidrs(key, nets)
+            checks.append(lambda ev, cs=cs, key=key: cs.contains(ev.get(key) or ""))
+
+    if not checks:
+        return None
+    checks = tuple(checks)
+
+    def match(ev: dict) -> bool:
+        for check in checks:
+            if not check(ev):
+                return False
+        return True
+    return match
@@ -0,0 +1,184 @@
+from __future__ import annotations
+import os
+import time
+import heapq
+import itertools
+import threading
+import collections
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+def _geo(side: str, field: str) -> Callable[[dict], Any]:
+    return lambda ev: (ev.get(side) or {}).get(field)
+
+# dimension name -> key extractor; events whose key is None/"" are not counted
+DIMENSIONS: Dict[str, Callable[[dict], Any]] = {
+    "src": lambda ev: ev.get("src"),
+    "dst": lambda ev: ev.get("dst"),
+    "dport": lambda ev: ev.get("dport"),
+    "proto": lambda ev: ev.get("proto"),
+    "src_country": _geo("src_geo", "country"),
+    "dst_country": _geo("dst_geo", "country"),
+}
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter summary holding at most `k` counters.
+    A new key arriving when full takes over the smallest counter and inherits
+    its count as `error`, so count - error <= true count <= count. The min
+    counter is found through a lazily-pruned heap, O(log k) per update.
+    """
+    __slots__ = ("k", "counts", "errors", "_heap", "_seq")
+
+    def __init__(self, k: int):
+        self.k = k
+        self.counts: Dict[Any, int] = {}
+        self.errors: Dict[Any, int] = {}
+        self._heap: List[Tuple[int, int, Any]] = []
+        self._seq = itertools.count()   # tie-breaker so keys of mixed types are never compared
+
+    def _push(self, key, count: int) -> None:
+        heapq.heappush(self._heap, (count, next(self._seq), key))
+        if len(self._heap) > 4 * self.k + 64:
+            self._heap = [(c, next(self._seq), key) for key, c in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[Any, int]:
+        while True:
+            count, _, key = heapq.heappop(self._heap)
+            if self.counts.get(key) == count:
+                return key, count
+
+    def add(self, key, weight: int = 1) -> None:
+        count = self.counts.get(key)
+        if count is not None:
+            count += weight
+        elif len(self.counts) < self.k:
+            count = weight
+            self.errors[key] = 0
+        else:
+            old, floor = self._pop_min()
+            del self.counts[old], self.errors[old]
+            count = floor + weight
+            self.errors[key] = floor
+        self.counts[key] = count
+        self._push(key, count)
+
+    def items(self) -> Iterable[Tuple[Any, int, int]]:
+        return ((key, c, self.errors[key]) for key, c in self.counts.items())
+
+def _merge(parts: Iterable[Iterable[Tuple[Any, int, int]]], keep: int) -> Dict[Any, Tuple[int, int]]:
+    """Sum (count, error) per key across summaries and keep the `keep` largest."""
+    acc: Dict[Any, List[int]] = {}
+    for part in parts:
+        for key, c, e in part:
+            slot = acc.get(key)
+            if slot is None:
+                acc[key] = [c, e]
+            else:
+                slot[0] += c
+                slot[1] += e
+    top = heapq.nlargest(keep, acc.items(), key=lambda kv: kv[1][0])
+    return {key: (c, e) for key, (c, e) in top}
+
+class WindowedTopK:
+    """
+    Top-k per dimension over sliding windows of recent ingest.
+
+    Time is cut into `bucket_secs` tumbling buckets, each holding one
+    SpaceSaving(k) per dimension, and only `retention_secs` of buckets are
+    kept, so memory is bounded by buckets x dimensions x k whatever the event
+    rate. A query merges the closed buckets in its window once per bucket
+    (cached until the next bucket opens) plus the live bucket, so answering
+    costs O(k) per dimension.
+    """
+
+    def __init__(self, dims: Dict[str, Callable[[dict], Any]] = DIMENSIONS, k: int = 64,
+                 bucket_secs: int = 10, retention_secs: int = 3600):
+        self.dims = dict(dims)
+        self.k = k
+        self.bucket_secs = bucket_secs
+        self.max_buckets = max(retention_secs // bucket_secs, 1)
+        self._buckets: collections.deque = collections.deque()   # (index, {dim: SpaceSaving}, total)
+        self._merged: Dict[Tuple[str, int], Dict[Any, Tuple[int, int]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def retention_secs(self) -> int:
+        return self.max_buckets * self.bucket_secs
+
+    def _bucket(self, now: float) -> list:
+        # caller holds self._lock
+        idx = int(now // self.bucket_secs)
+        if self._buckets and self._buckets[-1][0] >= idx:   # same bucket, or the clock stepped back
+            return self._buckets[-1]
+        bucket = [idx, {d: SpaceSaving(self.k) for d in self.dims}, 0]
+        self._buckets.append(bucket)
+        while self._buckets and self._buckets[0][0] <= idx - self.max_buckets:
+            self._buckets.popleft()
+        self._merged.clear()
+        return bucket
+
+    def add_batch(self, events: List[dict], now: float | None = None) -> None:
+        """Count a batch: keys are pre-aggregated per dimension, then applied under one lock."""
+        if not events:
+            return
+        counted = {d: collections.Counter() for d in self.dims}
+        for ev in events:
+            for d, key_of in self.dims.items():
+                key = key_of(ev)
+                if isinstance(key, (str, int)) and key != "":   # lists/dicts from bad input aren't keys
+                    counted[d][key] += 1
+        with self._lock:
+            bucket = self._bucket(time.time() if now is None else now)
+            for d, counter in counted.items():
+                summary = bucket[1][d]
+                for key, n in counter.items():
+                    summary.add(key, n)
+            bucket[2] += len(events)
+
+    def top(self, window_secs: int, dims: List[str] | None = None, n: int = 10,
+            now: float | None = None) -> dict:
+        """Heavy hitters per dimension over the last `window_secs` seconds (rounded up to whole buckets)."""
+        dims = [d for d in (dims or self.dims) if d in self.dims]
+        span = min(max(-(-int(window_secs) // self.bucket_secs), 1), self.max_buckets)
+        with self._lock:
+            live = self._bucket(time.time() if now is None else now)
+            first = live[0] - span + 1
+            closed = [b for b in self._buckets if first <= b[0] < live[0]]
+            out: Dict[str, list] = {}
+            for d in dims:
+                cached = self._merged.get((d, span))
+                if cached is None:
+                    cached = self._merged[(d, span)] = _merge((b[1][d].items() for b in closed), 4 * self.k)
+                merged = _merge([((key, c, e) for key, (c, e) in cached.items()), live[1][d].items()], n)
+                out[d] = [{"key": key, "count": c, "error": e}
+                          for key, (c, e) in sorted(merged.items(), key=lambda kv: -kv[1][0])]
+            total = live[2] + sum(b[2] for b in closed)
+        return {"window_secs": span * self.bucket_secs, "total": total, "top": out}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "buckets": len(self._buckets),
+                "bucket_secs": self.bucket_secs,
+                "retention_secs": self.retention_secs,
+                "k": self.k,
+                "dims": list(self.dims),
+            }
+
+traffic_stats = WindowedTopK(
+    k=int(os.getenv("TRAFFIC_STATS_K", "64")),
+    bucket_secs=int(os.getenv("TRAFFIC_STATS_BUCKET_SECS", "10")),
+    retention_secs=int(os.getenv("TRAFFIC_STATS_RETENTION_SECS", "3600")),
+)
+
+def parse_window(value: str | None, default: int = 300) -> int:
+    """'90', '90s', '5m', '1h' -> seconds. Raises ValueError."""
+    if not value:
+        return default
+    value = value.strip().lower()
+    unit = {"s": 1, "m": 60, "h": 3600}.get(value[-1])
+    secs = int(value[:-1]) * unit if unit else int(value)
+    if secs <= 0:
+        raise ValueError("window must be positive")
+    return secs
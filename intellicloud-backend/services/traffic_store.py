@@ -0,0 +1,176 @@
+from __future__ import annotations
+import os
+import json
+import time
+import atexit
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List
+from models.traffic_events import copy_traffic_events, event_day
+from services.write_behind import WriteBehindBuffer
+
+# postgres: COPY into daily partitions, spilling to segment files on failure
+# segments: segment files only
+# off:      don't persist traffic
+STORE_MODE = os.getenv("TRAFFIC_STORE", "postgres").lower()
+SEGMENT_DIR = os.getenv("TRAFFIC_SEGMENT_DIR", os.path.join(tempfile.gettempdir(), "intellicloud-traffic"))
+SEGMENT_MAX_BYTES = int(os.getenv("TRAFFIC_SEGMENT_MAX_MB", "64")) << 20
+SEGMENT_ROLL_SECS = float(os.getenv("TRAFFIC_SEGMENT_ROLL_SECS", "300"))
+# events stamped further back than this (or more than a day ahead) never
+# create partitions; they go to segment files instead
+BACKFILL_DAYS = int(os.getenv("TRAFFIC_STORE_BACKFILL_DAYS", "30"))
+
+OPEN_SUFFIX = ".ndjson.part"
+SEGMENT_SUFFIX = ".ndjson"
+
+class SegmentWriter:
+    """
+    Append-only NDJSON segment files, one event per line. The file being
+    written is `traffic-<day>-<pid>-<n>.ndjson.part`; it is renamed to
+    `.ndjson` once it passes max_bytes or roll_secs (or on exit), so loaders
+    only ever see complete segments.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = SEGMENT_MAX_BYTES, roll_secs: float = SEGMENT_ROLL_SECS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.roll_secs = roll_secs
+        self._lock = threading.Lock()
+        self._f = None
+        self._path = None
+        self._pid = None
+        self._opened = 0.0
+        self._n = 0
+        self._stats = {"events": 0, "bytes": 0, "segments": 0, "errors": 0}
+        atexit.register(self.close)
+
+    def append(self, events: List[dict]) -> int:
+        if not events:
+            return 0
+        data = "".join(json.dumps(ev, default=str) + "\n" for ev in events).encode()
+        with self._lock:
+            try:
+                self._roll_if_needed()
+                self._f.write(data)
+                self._f.flush()
+            except OSError as e:
+                self._stats["errors"] += len(events)
+                print("[traffic-store] segment write failed:", e)
+                return 0
+            self._stats["events"] += len(events)
+            self._stats["bytes"] += len(data)
+        return len(events)
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["dir"] = self.directory
+            out["open"] = self._path
+        return out
+
+    def _roll_if_needed(self) -> None:
+        # caller holds self._lock; a forked worker never writes to its parent's file
+        if self._f is not None and self._pid != os.getpid():
+            self._f = self._path = None
+        if self._f is not None:
+            if self._f.tell() < self.max_bytes and time.monotonic() - self._opened < self.roll_secs:
+                return
+            self._close()
+        os.makedirs(self.directory, exist_ok=True)
+        self._n += 1
+        day = datetime.now(timezone.utc).strftime("%Y%m%d")
+        self._path = os.path.join(self.directory, f"traffic-{day}-{os.getpid()}-{self._n}{OPEN_SUFFIX}")
+        self._f = open(self._path, "ab")
+        self._pid = os.getpid()
+        self._opened = time.monotonic()
+        self._stats["segments"] += 1
+
+    def _close(self) -> None:
+        if self._f is None:
+            return
+        try:
+            self._f.close()
+            os.replace(self._path, self._path[: -len(OPEN_SUFFIX)] + SEGMENT_SUFFIX)
+        except OSError as e:
+            print("[traffic-store] segment close failed:", e)
+        self._f = None
+        self._path = None
+
+segments = SegmentWriter(SEGMENT_DIR)
+_stats = {"db_rows": 0, "db_batches": 0, "spilled": 0, "out_of_window": 0}
+_stats_lock = threading.Lock()
+
+def _count(**kw) -> None:
+    with _stats_lock:
+        for k, v in kw.items():
+            _stats[k] += v
+
+def _flush(batch: List[dict]) -> None:
+    if STORE_MODE == "segments":
+        segments.append(batch)
+        return
+
+    today = datetime.now(timezone.utc).date()
+    lo, hi = today - timedelta(days=BACKFILL_DAYS), today + timedelta(days=1)
+    in_window, outside = [], []
+    for ev in batch:
+        (in_window if lo <= event_day(ev) <= hi else outside).append(ev)
+
+    if outside:
+        segments.append(outside)
+        _count(out_of_window=len(outside))
+    if not in_window:
+        return
+    try:
+        n = copy_traffic_events(in_window)
+        _count(db_rows=n, db_batches=1)
+    except Exception as e:
+        print(f"[traffic-store] COPY of {len(in_window)} events failed, spilling to segments:", e)
+        segments.append(in_window)
+        _count(spilled=len(in_window))
+
+store_buffer = WriteBehindBuffer(
+    _flush,
+    name="traffic-store",
+    max_items=int(os.getenv("TRAFFIC_STORE_BUFFER_MAX", "50000")),
+    batch_size=int(os.getenv("TRAFFIC_STORE_FLUSH_ROWS", "5000")),
+    interval=float(os.getenv("TRAFFIC_STORE_FLUSH_SECS", "1.0")),
+)
+
+def store_events(events: List[dict]) -> int:
+    """Queue normalized events for persistence; never blocks on I/O. Returns how many were accepted."""
+    if STORE_MODE == "off" or not events:
+        return 0
+    return store_buffer.put_many(events)
+
+def load_segment(path: str) -> int:
+    """
+    COPY one closed segment file into Postgres (one transaction, so a failed
+    load can simply be retried) and rename it to `.loaded`. Returns rows loaded.
+    """
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    n = copy_traffic_events(events)
+    os.replace(path, path + ".loaded")
+    return n
+
+def traffic_store_stats() -> dict:
+    with _stats_lock:
+        out = dict(_stats)
+    out["mode"] = STORE_MODE
+    out["buffer"] = store_buffer.stats()
+    out["segments"] = segments.stats()
+    return out
@@ -0,0 +1,112 @@
+import os
+import time
+import atexit
+import threading
+import collections
+from typing import Any, Callable, List
+
+class WriteBehindBuffer:
+    """
+    Bounded in-process queue drained by one background thread.
+
+    put() never touches the database: items are handed to `flush(batch)` once
+    `batch_size` are waiting or `interval` seconds have passed, whichever comes
+    first. When the buffer is full new items are dropped and counted. The
+    buffer is drained on interpreter exit (and by stop()).
+    """
+
+    def __init__(self, flush: Callable[[List[Any]], None], name: str = "write-behind",
+                 max_items: int = 10000, batch_size: int = 500, interval: float = 1.0):
+        self.name = name
+        self.max_items = max_items
+        self.batch_size = batch_size
+        self.interval = interval
+        self._flush = flush
+        self._q = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._stats = {"queued": 0, "flushed": 0, "dropped": 0, "failed": 0, "batches": 0}
+        atexit.register(self.stop)
+
+    def put(self, item: Any) -> bool:
+        """Queue one item. Returns False (and counts a drop) when the buffer is full."""
+        with self._cond:
+            self._ensure_started()
+            if len(self._q) >= self.max_items:
+                self._stats["dropped"] += 1
+                return False
+            self._q.append(item)
+            self._stats["queued"] += 1
+            if len(self._q) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def put_many(self, items: List[Any]) -> int:
+        """Queue a batch under one lock. Returns how many fit; the rest are counted as drops."""
+        with self._cond:
+            self._ensure_started()
+            room = max(self.max_items - len(self._q), 0)
+            accepted = items[:room]
+            self._q.extend(accepted)
+            self._stats["queued"] += len(accepted)
+            self._stats["dropped"] += len(items) - len(accepted)
+            if len(self._q) >= self.batch_size:
+                self._cond.notify()
+        return len(accepted)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush everything still queued and stop the worker thread."""
+        with self._cond:
+            thread = self._thread if self._pid == os.getpid() else None
+            self._stopping = True
+            self._cond.notify()
+        if thread and thread.is_alive():
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            out["pending"] = len(self._q)
+            out["capacity"] = self.max_items
+        return out
+
+    def _ensure_started(self) -> None:
+        # caller holds self._cond; a forked worker gets its own thread and an empty queue
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        if self._pid is not None and self._pid != os.getpid():
+            self._q.clear()
+        self._pid = os.getpid()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.interval
+                while len(self._q) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                n = min(len(self._q), self.batch_size)
+                batch = [self._q.popleft() for _ in range(n)]
+                done = self._stopping and not self._q
+            if batch:
+                self._flush_batch(batch)
+            if done:
+                return
+
+    def _flush_batch(self, batch: List[Any]) -> None:
+        try:
+            self._flush(batch)
+            ok = True
+        except Exception as e:
+            print(f"[{self.name}] flush of {len(batch)} items failed:", e)
+            ok = False
+        with self._cond:
+            self._stats["batches"] += 1
+            self._stats["flushed" if ok else "failed"] += len(batch)
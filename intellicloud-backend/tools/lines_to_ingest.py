@@ -1,120 +1,387 @@
-import sys, os, json, time, urllib.request, urllib.error
+"""
+Ship tshark CSV lines (stdin) to /api/traffic/ingest.
+
+    tshark -l -T fields -E header=y -E separator=, -e frame.time_epoch ... | python tools/lines_to_ingest.py
+
+A reader thread drains stdin so tshark never blocks on us; the main thread
+parses and batches; SENDERS threads post batches over keep-alive connections
+(FORMAT/COMPRESS bodies), retrying with jittered backoff. Batches that can't be sent
+(backend down, or the send queue full) are appended to SPILL_FILE and replayed
+once the backend answers again, including on the next run. Throughput and lag
+go to stderr every STATS_SECS.
+"""
+import sys, os, json, time, gzip, queue, random, threading, http.client
+from urllib.parse import urlsplit
 from typing import List, Dict, Any
+import msgpack
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.capture import FIELDS, header_index, parse_row
+from services.flows import FlowTable
 
 API_URL = os.getenv("API_URL", "http://localhost:5000/api/traffic/ingest")
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", "50"))
 BATCH_SECS = float(os.getenv("BATCH_SECS", ".5"))
+# FLOWS=1 ships one record per 5-tuple flow instead of one per packet
+FLOWS = os.getenv("FLOWS", "0").lower() in ("1", "true", "yes")
+FLOW_IDLE_SECS = float(os.getenv("FLOW_IDLE_SECS", "15"))
+FLOW_ACTIVE_SECS = float(os.getenv("FLOW_ACTIVE_SECS", "60"))
+
+SENDERS = int(os.getenv("SENDERS", "4"))
+QUEUE_BATCHES = int(os.getenv("QUEUE_BATCHES", "64"))       # batches waiting for a sender before we spill
+# body format: json ({"items": [...]}), ndjson or msgpack (streamed by the backend as it arrives)
+FORMAT = os.getenv("FORMAT", "json").lower()
+COMPRESS = os.getenv("COMPRESS", "gzip").lower()      # gzip, zstd or none
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+RETRIES = int(os.getenv("RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("BACKOFF_BASE", ".25"))
+BACKOFF_MAX = float(os.getenv("BACKOFF_MAX", "10"))
+SPILL_FILE = os.getenv("SPILL_FILE", "lines_to_ingest.spill.ndjson")
+SPILL_RETRY_SECS = float(os.getenv("SPILL_RETRY_SECS", "15"))
+STATS_SECS = float(os.getenv("STATS_SECS", "10"))
 
 header: List[str] = []
 index: Dict[str, int] = {}
 batch: List[Dict[str, Any]] = []
 last_send = time.time()
+flows = FlowTable(FLOW_IDLE_SECS, FLOW_ACTIVE_SECS) if FLOWS else None
+
+class Stats:
+    """Counters shared by all threads; report() prints the rates since the last call."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.c = {"lines": 0, "events": 0, "sent": 0, "batches": 0, "retries": 0,
+                  "spilled": 0, "replayed": 0, "rejected": 0}
+        self.newest_ts = 0.0      # newest event time the backend has acknowledged
+        self.lag_sum = 0.0        # enqueue -> ack, summed over batches since the last report
+        self.lag_n = 0
+        self._last = (time.time(), 0)
+
+    def add(self, key: str, n: int = 1) -> None:
+        with self.lock:
+            self.c[key] += n
+
+    def acked(self, items: List[Dict[str, Any]], queued_at: float | None) -> None:
+        newest = max((ev.get("ts") or 0 for ev in items), default=0)
+        with self.lock:
+            self.c["sent"] += len(items)
+            self.c["batches"] += 1
+            if newest > self.newest_ts:
+                self.newest_ts = newest
+            if queued_at is not None:
+                self.lag_sum += time.time() - queued_at
+                self.lag_n += 1
+
+    def report(self, pending: int) -> None:
+        now = time.time()
+        with self.lock:
+            c = dict(self.c)
+            lag = self.lag_sum / self.lag_n if self.lag_n else 0.0
+            self.lag_sum, self.lag_n = 0.0, 0
+            behind = now - self.newest_ts if self.newest_ts else 0.0
+        then, sent_then = self._last
+        self._last = (now, c["sent"])
+        rate = (c["sent"] - sent_then) / max(now - then, 1e-6)
+        sys.stderr.write(
+            f"[ingest] {rate:.0f} ev/s  sent={c['sent']} batches={c['batches']} read={c['lines']} "
+            f"queued={pending}/{QUEUE_BATCHES} retries={c['retries']} spilled={c['spilled']} "
+            f"replayed={c['replayed']} rejected={c['rejected']} lag={lag * 1000:.0f}ms behind={behind:.1f}s\n"
+        )
+
+stats = Stats()
+
+def _encode(items: List[Dict[str, Any]]) -> tuple[bytes, Dict[str, str]]:
+    if FORMAT == "msgpack":
+        body = b"".join(msgpack.packb(ev) for ev in items)
+        headers = {"Content-Type": "application/msgpack"}
+    elif FORMAT == "ndjson":
+        body = "".join(json.dumps(ev, separators=(",", ":")) + "\n" for ev in items).encode()
+        headers = {"Content-Type": "application/x-ndjson"}
+    else:
+        body = json.dumps({"items": items}, separators=(",", ":")).encode()
+        headers = {"Content-Type": "application/json"}
+    if COMPRESS == "gzip":
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    elif COMPRESS == "zstd":
+        body = zstandard.ZstdCompressor(level=3).compress(body)
+        headers["Content-Encoding"] = "zstd"
+    return body, headers
+
+def _backoff(attempt: int) -> float:
+    # "full jitter": spreads the senders out so they don't hammer a recovering backend in step
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+class Sender:
+    """One keep-alive connection to the ingest endpoint; not thread-safe, one per thread."""
+
+    def __init__(self, url: str = API_URL):
+        u = urlsplit(url)
+        self.https = u.scheme == "https"
+        self.host = u.hostname or "localhost"
+        self.port = u.port
+        self.path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        self.conn = None
+        self.rejected = 0     # events in batches the backend refused with a 4xx
+
+    def _post(self, body: bytes, headers: Dict[str, str]) -> int:
+        if self.conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self.conn = cls(self.host, self.port, timeout=HTTP_TIMEOUT)
+        try:
+            self.conn.request("POST", self.path, body, headers)
+            resp = self.conn.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        if resp.will_close:
+            self.close()
+        return resp.status
+
+    def send(self, items: List[Dict[str, Any]], retries: int = RETRIES) -> bool:
+        """
+        Post one batch. False means the backend couldn't take it and the caller
+        should keep it; a 4xx-refused batch returns True (resending can't help)
+        and is counted in self.rejected.
+        """
+        body, headers = _encode(items)
+        err: Any = None
+        for attempt in range(retries + 1):
+            if attempt:
+                stats.add("retries")
+                time.sleep(_backoff(attempt - 1))
+            try:
+                status = self._post(body, headers)
+            except (OSError, http.client.HTTPException) as e:
+                err = e
+                continue
+            if status < 300:
+                return True
+            if status < 500 and status != 429:
+                # the same body will be refused again; dropping beats spilling it forever
+                sys.stderr.write(f"[ingest] batch of {len(items)} rejected: HTTP {status}\n")
+                stats.add("rejected", len(items))
+                self.rejected += len(items)
+                return True
+            err = f"HTTP {status}"
+        sys.stderr.write(f"[ingest] error after {retries + 1} attempts: {err}\n")
+        return False
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+class Spill:
+    """
+    Append-only NDJSON file of unsent batches, one {"items": [...]} per line.
+    take() renames it aside so new spills keep going to a fresh file while
+    the old one is replayed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.replaying = threading.Lock()
+
+    def write(self, items: List[Dict[str, Any]]) -> None:
+        if not items:
+            return
+        self.write_lines([json.dumps({"items": items}, separators=(",", ":")) + "\n"])
+        stats.add("spilled", len(items))
 
-FIELDS = [
-    "frame.time_epoch",
-    "ip.src", "ip.dst",
-    "ipv6.src", "ipv6.dst",
-    "tcp.srcport", "tcp.dstport",
-    "udp.srcport", "udp.dstport",
-    "tcp.flags.syn", "tcp.flags.ack",
-    "dns.qry.name",
-]
-
-def _post(items: List[Dict[str, Any]]) -> None:
+    def write_lines(self, lines: List[str]) -> None:
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def take(self) -> List[str]:
+        """Paths to replay: leftovers from earlier runs plus the current file."""
+        d = os.path.dirname(os.path.abspath(self.path))
+        base = os.path.basename(self.path)
+        with self.lock:
+            if os.path.exists(self.path) and os.path.getsize(self.path):
+                os.replace(self.path, f"{self.path}.{time.time_ns()}.{os.getpid()}.replay")
+            return sorted(os.path.join(d, n) for n in os.listdir(d)
+                          if n.startswith(base + ".") and n.endswith(".replay"))
+
+    def replay(self, sender: Sender) -> int:
+        """Resend spilled batches in order; stops at the first failure and puts the rest back."""
+        with self.replaying:
+            return self._replay(sender)
+
+    def _replay(self, sender: Sender) -> int:
+        sent = 0
+        for path in self.take():
+            with open(path, encoding="utf-8") as f:
+                lines = f.readlines()
+            for i, line in enumerate(lines):
+                try:
+                    items = json.loads(line)["items"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if not sender.send(items, retries=1):
+                    self.write_lines(lines[i:])
+                    os.remove(path)
+                    return sent
+                stats.acked(items, None)
+                stats.add("replayed", len(items))
+                sent += len(items)
+            os.remove(path)
+        return sent
+
+spill = Spill(SPILL_FILE)
+send_q: "queue.Queue[tuple[float, List[Dict[str, Any]]] | None]" = queue.Queue(maxsize=QUEUE_BATCHES)
+line_q: "queue.Queue[List[str] | None]" = queue.Queue(maxsize=256)
+down_until = 0.0      # after a batch exhausts its retries, skip straight to the spill until then
+stopping = threading.Event()
+
+def _sender_loop() -> None:
+    global down_until
+    sender = Sender()
+    while True:
+        job = send_q.get()
+        if job is None:
+            break
+        queued_at, items = job
+        if time.time() < down_until:
+            spill.write(items)
+        elif sender.send(items):
+            stats.acked(items, queued_at)
+        else:
+            down_until = time.time() + SPILL_RETRY_SECS
+            spill.write(items)
+    sender.close()
+
+def _replay_loop() -> None:
+    sender = Sender()
+    while not stopping.wait(SPILL_RETRY_SECS):
+        if time.time() >= down_until:
+            spill.replay(sender)
+    sender.close()
+
+def _stats_loop() -> None:
+    while not stopping.wait(STATS_SECS):
+        stats.report(send_q.qsize())
+
+def _read_stdin() -> None:
+    # read1 returns whatever the pipe has, so lines reach the batcher as soon as tshark writes them
+    buf = sys.stdin.buffer
+    rest = b""
+    while True:
+        chunk = buf.read1(1 << 16)
+        if not chunk:
+            break
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        line_q.put([ln.decode("utf-8", "replace") for ln in lines])
+    if rest:
+        line_q.put([rest.decode("utf-8", "replace")])
+    line_q.put(None)
+
+def _submit(items: List[Dict[str, Any]]) -> None:
     if not items:
         return
-    data = json.dumps({"items": items}).encode()
-    req = urllib.request.Request(API_URL, data=data, headers={"Content-Type": "application/json"})
+    stats.add("events", len(items))
     try:
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            sys.stderr.write(f"[ingest] sent {len(items)} events -> {resp.status} \n")
-    except urllib.error.URLError as e:
-        sys.stderr.write(f"[ingest] error: {e}\n")
-
-def _get(colname: str, cols: List[str]) -> str:
-    """safe column accessor by name."""
-    i = index.get(colname, -1)
-    if i < 0 or i >= len(cols):
-        return ""
-    return cols[i]
+        send_q.put_nowait((time.time(), items))
+    except queue.Full:
+        spill.write(items)    # the backend is behind; parsing must not stall on it
 
 def _flush_if_needed() -> None:
     global batch, last_send
     now = time.time()
     if len(batch) >= BATCH_SIZE or (now - last_send) >= BATCH_SECS:
-        _post(batch)
+        _submit(batch)
         batch = []
         last_send = now
 
-def main() -> None:
-    global header, index, batch, last_send
+def _read_line(line: str) -> None:
+    global header, index
+    line = line.strip()
+    if not line:
+        return
 
-    for raw in sys.stdin:
-        line = raw.strip()
-        if not line:
-            continue
+    if not header:
+        header = line.split(",")
+        index = header_index(line)
 
-        if not header:
-            header = line.split(",")
-            index = {name: i for i, name in enumerate(header)}
+        missing = [f for f in FIELDS if f not in index]
+        if missing:
+            sys.stderr.write(f"[warn] tshark header missing {missing}; proceeding anyway \n")
+        return
 
-            missing = [f for f in FIELDS if f not in index]
-            if missing:
-                sys.stderr.write(f"[warn] tshark header missing {missing}; proceeding anyway \n")
-            continue
-    cols = line.split(",")
+    ev = parse_row(line.split(","), index)
+    if ev is None:
+        return
+    if flows is not None:
+        batch.extend(flows.add(ev))     # completed flows only; packets stay in the table
+    else:
+        batch.append(ev)
+
+def main() -> None:
+    global batch
+    if FORMAT not in ("json", "ndjson", "msgpack") or COMPRESS not in ("gzip", "zstd", "none"):
+        sys.exit(f"[ingest] FORMAT must be json/ndjson/msgpack and COMPRESS gzip/zstd/none (got {FORMAT}/{COMPRESS})")
+    if COMPRESS == "zstd" and zstandard is None:
+        sys.exit("[ingest] COMPRESS=zstd needs the zstandard package")
+    threading.Thread(target=_read_stdin, name="stdin", daemon=True).start()
+    senders = [threading.Thread(target=_sender_loop, name=f"sender-{i}", daemon=True) for i in range(max(SENDERS, 1))]
+    for t in senders:
+        t.start()
+    threading.Thread(target=_replay_loop, name="spill-replay", daemon=True).start()
+    if STATS_SECS > 0:
+        threading.Thread(target=_stats_loop, name="stats", daemon=True).start()
 
     try:
-        ts = float(_get("frame.time_epoch", cols) or time.time())
-    except ValueError:
-        ts = time.time()
+        while True:
+            try:
+                lines = line_q.get(timeout=BATCH_SECS)
+            except queue.Empty:
+                lines = []
+            if lines is None:
+                break
+            stats.add("lines", len(lines))
+            for line in lines:
+                _read_line(line)
+                if len(batch) >= BATCH_SIZE:
+                    _flush_if_needed()
+            if flows is not None:
+                # idle flows close on wall time too, so a quiet link still emits them
+                batch.extend(flows.expire(time.time()))
+            _flush_if_needed()
 
-    ip4s, ip4d = _get("ip.src", cols), _get("ip.dst", cols)
-    ip6s, ip6d = _get("ipv6.src", cols), _get("ipv6.dst", cols)
-    src = ip4s or ip6s
-    dst = ip4d or ip6d
-    if not (src and dst):
-        pass
+        if flows is not None:
+            batch.extend(flows.flush())
+            sys.stderr.write(f"[ingest] flows: {flows.stats}\n")
+        _submit(batch)
+        batch = []
+        for _ in senders:
+            send_q.put(None)
+        for t in senders:
+            t.join()
+    except KeyboardInterrupt:
+        # keep what's still queued; the next run replays it
+        while True:
+            try:
+                job = send_q.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                spill.write(job[1])
+        spill.write(batch)
 
-    t_s, t_d = _get("tcp.srcport", cols), _get("tcp.dstport", cols)
-    u_s, u_d = _get("udp.srcport", cols), _get("udp.dstport", cols)
+    stopping.set()
+    if time.time() >= down_until:
+        spill.replay(Sender())
+    stats.report(send_q.qsize())
 
-    try:
-        sport = int(t_s or u_s) if (t_s or u_s) else None
-    except ValueError:
-        sport = None
-    
-    try:
-        dport = int(t_d or u_d) if (t_d or u_d) else None
-    except ValueError:
-        dport = None
-
-    proto = "tcp" if (t_s or t_d) else ("udp" if (u_s or u_d) else "ip")
-    syn = _get("tcp.flags.syn", cols) == "1"
-    ack = _get("tcp.flags.ack", cols) == "1"
-    dns = _get("dns.qry.name", cols) or None
-
-    ev: Dict[str, Any] = {
-        "ts": ts,
-        "src": src,
-        "dst": dst,
-        "proto": proto,
-        "sport": sport,
-        "dport": dport,
-        "syn": syn,
-        "ack": ack,
-    }
-
-    if dns:
-        ev["dns"] = dns
-
-    batch.append(ev)
-    _flush_if_needed()
-
-_post(batch)
-
-if __name__ == "__name__":
-    try:
-        main()
-    except KeyboardInterrupt:
-        pass
\ No newline at end of file
+if __name__ == "__main__":
+    main()
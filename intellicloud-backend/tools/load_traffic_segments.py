@@ -0,0 +1,35 @@
+"""
+Load traffic segment files (written when Postgres was unreachable, or with
+TRAFFIC_STORE=segments) into the partitioned traffic_events table.
+
+    python tools/load_traffic_segments.py              # every closed segment in TRAFFIC_SEGMENT_DIR
+    python tools/load_traffic_segments.py FILE [...]   # specific files
+
+Loaded files are renamed to *.loaded; files still being written (*.part) are skipped.
+"""
+import os, sys, glob
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+def main(argv: list[str]) -> int:
+    load_dotenv()
+    from services.traffic_store import SEGMENT_DIR, SEGMENT_SUFFIX, load_segment
+
+    paths = argv or sorted(glob.glob(os.path.join(SEGMENT_DIR, "*" + SEGMENT_SUFFIX)))
+    if not paths:
+        print(f"[segments] nothing to load in {SEGMENT_DIR}")
+        return 0
+    failed = 0
+    for path in paths:
+        try:
+            n = load_segment(path)
+            print(f"[segments] {os.path.basename(path)}: {n} rows")
+        except Exception as e:
+            failed += 1
+            sys.stderr.write(f"[segments] {os.path.basename(path)} failed: {e}\n")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,62 @@
+"""
+Apply versioned SQL migrations from migrations/ in filename order.
+
+Each file runs in its own transaction and is recorded in schema_migrations,
+so re-running only applies what is new:
+
+    python tools/migrate.py            # apply pending migrations
+    python tools/migrate.py --list     # show applied / pending
+"""
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from models.db import get_db_connection
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+def _migration_files() -> list[str]:
+    return sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith(".sql"))
+
+def main(argv: list[str]) -> int:
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        sys.stderr.write("[migrate] no DB connection\n")
+        return 1
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version    TEXT PRIMARY KEY,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+            cur.execute("SELECT version FROM schema_migrations")
+            applied = {r["version"] for r in cur.fetchall()}
+
+        pending = [f for f in _migration_files() if f not in applied]
+        if "--list" in argv:
+            for f in _migration_files():
+                print(f"{'applied' if f in applied else 'pending'}  {f}")
+            return 0
+
+        for name in pending:
+            with open(os.path.join(MIGRATIONS_DIR, name), "r", encoding="utf-8") as f:
+                sql = f.read()
+            with conn, conn.cursor() as cur:
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (name,))
+            print(f"[migrate] applied {name}")
+        if not pending:
+            print("[migrate] up to date")
+        return 0
+    except Exception as e:
+        sys.stderr.write(f"[migrate] failed: {e}\n")
+        return 1
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,269 @@
+"""
+Replay capture exports offline, in parallel: tshark CSV (same columns as
+lines_to_ingest.py) or pcap files, split into shards across a process pool.
+
+    # normalize, score and geo-enrich locally; write columnar files
+    python tools/replay_captures.py --out out/ captures/*.csv day.pcap
+    python tools/replay_captures.py --out $TRAFFIC_SEGMENT_DIR --format segments day.csv   # then load_traffic_segments.py
+
+    # post raw events to the ingest API, 20k events/s across all workers
+    python tools/replay_captures.py --api http://localhost:5000/api/traffic/ingest --rate 20000 day.pcap
+
+CSV files are cut into --shard-mb byte ranges on line boundaries; pcap files
+are one shard each (pcapng needs tshark on PATH). File output runs the same
+normalize_batch() as /traffic/ingest (direction, level, geo from the local
+GeoLite2 files); API output sends raw events and lets the backend do it, with
+FORMAT/COMPRESS/RETRIES as in lines_to_ingest.py. Batches the API still
+can't take after retries land in SPILL_FILE.<...>.replay, which
+lines_to_ingest.py resends on its next run; batches it refuses with a 4xx
+are dropped and reported as rejected (exit status 1). --flows aggregates per shard, so
+a flow that crosses a shard boundary is reported as two records.
+"""
+import os, sys, time, json, argparse, multiprocessing
+from typing import Any, Dict, Iterator, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # --format parquet needs it; npz and segments don't
+    pa = pq = None
+
+from dotenv import load_dotenv
+from services.capture import is_pcap, iter_csv, iter_pcap
+from services.flows import FlowTable
+from services.geo import load_readers
+from services.ingest_decode import chunked
+from services.traffic_pipeline import normalize_batch
+
+FORMATS = ("npz", "parquet", "segments")
+CAPTURE_EXTS = (".csv", ".pcap", ".cap", ".pcapng")
+
+# column -> (numpy dtype, null stand-in) for the columnar formats
+COLUMNS = {
+    "ts": ("float64", float("nan")),
+    "eid": ("str", ""),
+    "src": ("str", ""),
+    "dst": ("str", ""),
+    "proto": ("str", ""),
+    "sport": ("int32", -1),
+    "dport": ("int32", -1),
+    "dir": ("str", ""),
+    "level": ("str", ""),
+    "dns": ("str", ""),
+    "src_country": ("str", ""),
+    "src_asn": ("int64", 0),
+    "dst_country": ("str", ""),
+    "dst_asn": ("int64", 0),
+}
+FLOW_COLUMNS = {
+    "packets": ("int64", -1),
+    "bytes": ("int64", -1),
+    "duration": ("float64", float("nan")),
+}
+
+opts: Dict[str, Any] = {}
+readers: Dict[str, Any] = {}
+pace_clock = None     # shared by all workers so --rate holds however the shards are sized
+
+def _init(options: Dict[str, Any], clock) -> None:
+    global opts, readers, pace_clock
+    opts = options
+    pace_clock = clock
+    if opts["out"]:
+        readers = load_readers()
+
+def _shards(paths: List[str], shard_bytes: int) -> List[tuple]:
+    """(kind, path, start, end) tasks, biggest first so the pool finishes evenly."""
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files += sorted(os.path.join(p, n) for n in os.listdir(p) if n.lower().endswith(CAPTURE_EXTS))
+        else:
+            files.append(p)
+    tasks = []
+    for path in files:
+        size = os.path.getsize(path)
+        if is_pcap(path):
+            tasks.append((size, ("pcap", path, 0, None)))
+            continue
+        for start in range(0, max(size, 1), shard_bytes):
+            tasks.append((min(shard_bytes, size - start), ("csv", path, start, start + shard_bytes)))
+    return [t for _, t in sorted(tasks, key=lambda t: -t[0])]
+
+def _events(kind: str, path: str, start: int, end: int | None, counts: Dict[str, int]) -> Iterator[dict]:
+    packets = iter_pcap(path) if kind == "pcap" else iter_csv(path, start, end)
+    if not opts["flows"]:
+        for ev in packets:
+            counts["packets"] += 1
+            yield ev
+        return
+    table = FlowTable(opts["flow_idle"], opts["flow_active"])
+    for ev in packets:
+        counts["packets"] += 1
+        yield from table.add(ev)
+    yield from table.flush()
+
+def _row(ev: dict) -> Dict[str, Any]:
+    s_geo, d_geo = ev.get("src_geo") or {}, ev.get("dst_geo") or {}
+    row = {k: ev.get(k) for k in ("ts", "eid", "src", "dst", "proto", "sport", "dport", "dir", "level", "dns")}
+    row.update(src_country=s_geo.get("country"), src_asn=s_geo.get("asn"),
+               dst_country=d_geo.get("country"), dst_asn=d_geo.get("asn"))
+    if opts["flows"]:
+        row["packets"] = ev["packets"] + ev.get("resp_packets", 0) if "packets" in ev else None
+        row["bytes"] = ev["bytes"] + ev.get("resp_bytes", 0) if "bytes" in ev else None
+        row["duration"] = ev.get("duration")
+    return row
+
+class _ColumnWriter:
+    """Buffers rows as columns and writes one npz/parquet part per `rows_per_file` rows."""
+
+    def __init__(self, stem: str, fmt: str):
+        self.stem = stem
+        self.fmt = fmt
+        self.spec = {**COLUMNS, **(FLOW_COLUMNS if opts["flows"] else {})}
+        self.cols: Dict[str, list] = {c: [] for c in self.spec}
+        self.parts: List[str] = []
+
+    def add(self, events: List[dict]) -> None:
+        for ev in events:
+            for c, v in _row(ev).items():
+                self.cols[c].append(v)
+        if len(self.cols["ts"]) >= opts["rows_per_file"]:
+            self.flush()
+
+    def flush(self) -> None:
+        n = len(self.cols["ts"])
+        if not n:
+            return
+        path = os.path.join(opts["out"], f"{self.stem}-{len(self.parts):03d}.{self.fmt}")
+        tmp = path + ".part"
+        if self.fmt == "parquet":
+            pq.write_table(pa.table(self.cols), tmp, compression="zstd")
+        else:
+            arrays = {}
+            for c, (dtype, null) in self.spec.items():
+                vals = [null if v is None else v for v in self.cols[c]]
+                arrays[c] = np.array(vals, dtype=dtype if dtype != "str" else np.str_)
+            with open(tmp, "wb") as f:
+                np.savez_compressed(f, **arrays)
+        os.replace(tmp, path)
+        self.parts.append(path)
+        self.cols = {c: [] for c in self.spec}
+
+class _SegmentWriter:
+    """Normalized events as NDJSON, the format tools/load_traffic_segments.py loads."""
+
+    def __init__(self, stem: str):
+        self.path = os.path.join(opts["out"], f"traffic-{stem}.ndjson")
+        self.f = open(self.path + ".part", "w", encoding="utf-8")
+        self.parts = [self.path]
+
+    def add(self, events: List[dict]) -> None:
+        self.f.write("".join(json.dumps(ev, default=str) + "\n" for ev in events))
+
+    def flush(self) -> None:
+        self.f.close()
+        os.replace(self.path + ".part", self.path)
+
+def _pace(n: int) -> None:
+    """Reserve n events of the global --rate budget (about a second of burst allowed) and wait for it."""
+    if opts["rate"] <= 0:
+        return
+    with pace_clock.get_lock():
+        now = time.time()
+        due = max(pace_clock.value, now - 1.0) + n / opts["rate"]
+        pace_clock.value = due
+    if due > now:
+        time.sleep(due - now)
+
+def _run(task: tuple) -> Dict[str, Any]:
+    kind, path, start, end = task
+    shard = start // opts["shard_bytes"] if kind == "csv" else 0
+    stem = f"{os.path.splitext(os.path.basename(path))[0]}-{shard:04d}"
+    counts = {"packets": 0, "events": 0, "failed": 0, "rejected": 0}
+    out: Dict[str, Any] = {"shard": f"{os.path.basename(path)}#{shard}", "files": []}
+    t0 = time.time()
+    try:
+        events = _events(kind, path, start, end, counts)
+        if opts["api"]:
+            from tools.lines_to_ingest import SPILL_FILE, Sender, Spill
+            sender = Sender(opts["api"])
+            spill = Spill(f"{SPILL_FILE}.{time.time_ns()}.{os.getpid()}.replay")
+            for chunk in chunked(events, opts["batch"]):
+                _pace(len(chunk))
+                before = sender.rejected
+                if sender.send(chunk):
+                    key = "rejected" if sender.rejected > before else "events"
+                    counts[key] += len(chunk)
+                else:
+                    spill.write(chunk)
+                    counts["failed"] += len(chunk)
+            sender.close()
+        else:
+            writer = _SegmentWriter(stem) if opts["format"] == "segments" else _ColumnWriter(stem, opts["format"])
+            for chunk in chunked(events, opts["batch"]):
+                norm = normalize_batch(chunk, readers)
+                writer.add(norm)
+                counts["events"] += len(norm)
+            writer.flush()
+            out["files"] = writer.parts
+    except Exception as e:
+        out["error"] = f"{type(e).__name__}: {e}"
+    out.update(counts, secs=round(time.time() - t0, 2))
+    return out
+
+def main(argv: List[str]) -> int:
+    load_dotenv()
+    ap = argparse.ArgumentParser(description="Replay tshark CSV / pcap captures into IntellICloud, in parallel.")
+    ap.add_argument("paths", nargs="+", help="capture files or directories of them")
+    dest = ap.add_mutually_exclusive_group(required=True)
+    dest.add_argument("--api", help="ingest URL to post raw events to")
+    dest.add_argument("--out", help="directory for normalized output files")
+    ap.add_argument("--format", choices=FORMATS, default="npz", help="file format with --out (default npz)")
+    ap.add_argument("--rate", type=float, default=0, help="events/s across all workers with --api (0 = unlimited)")
+    ap.add_argument("--procs", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--shard-mb", type=int, default=64, help="CSV shard size")
+    ap.add_argument("--batch", type=int, default=5000, help="events per API request / normalize_batch call")
+    ap.add_argument("--rows-per-file", type=int, default=250000, help="rows per npz/parquet part")
+    ap.add_argument("--flows", action="store_true", help="aggregate packets into 5-tuple flows first")
+    ap.add_argument("--flow-idle", type=float, default=float(os.getenv("FLOW_IDLE_SECS", "15")))
+    ap.add_argument("--flow-active", type=float, default=float(os.getenv("FLOW_ACTIVE_SECS", "60")))
+    args = ap.parse_args(argv)
+
+    if args.format == "parquet" and pq is None:
+        ap.error("--format parquet needs pyarrow (pip install pyarrow)")
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    options = dict(vars(args), shard_bytes=args.shard_mb << 20, procs=max(args.procs, 1))
+    tasks = _shards(args.paths, options["shard_bytes"])
+    if not tasks:
+        sys.stderr.write("[replay] no capture files\n")
+        return 1
+
+    t0 = time.time()
+    total = {"packets": 0, "events": 0, "failed": 0, "rejected": 0}
+    errors = 0
+    with multiprocessing.Pool(options["procs"], initializer=_init,
+                              initargs=(options, multiprocessing.Value("d", 0.0))) as pool:
+        for res in pool.imap_unordered(_run, tasks):
+            for k in total:
+                total[k] += res[k]
+            if "error" in res:
+                errors += 1
+                sys.stderr.write(f"[replay] {res['shard']} failed after {res['events']} events: {res['error']}\n")
+            else:
+                rejected = f", {res['rejected']} rejected" if res["rejected"] else ""
+                sys.stderr.write(f"[replay] {res['shard']}: {res['packets']} packets -> {res['events']} events{rejected} "
+                                 f"in {res['secs']}s {' '.join(res['files'])}\n")
+    secs = time.time() - t0
+    sys.stderr.write(f"[replay] {len(tasks)} shards, {total['packets']} packets, {total['events']} events "
+                     f"({total['events'] / max(secs, 1e-6):.0f}/s), {total['rejected']} rejected, "
+                     f"{total['failed']} spilled, {errors} failed, {secs:.1f}s on {options['procs']} procs\n")
+    return 1 if errors or total["failed"] or total["rejected"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))